@@ -0,0 +1,216 @@
+import gc
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+from rummikub import Color, Game, TempSet
+from selfplay import COLORS, RandomPolicy, SolverPolicy, play_game
+
+# benchmarks for the hot paths of self-play. every benchmark runs for each combination of player count, joker
+# count and board size, reports operations per second and allocations per operation, and can be saved as
+# JSON and compared against an earlier run to catch slowdowns:
+#
+#   python benchmark.py --out bench.json
+#   python benchmark.py --baseline bench.json        # exits with 1 if anything got slower than --tolerance
+#
+# board sizes are reached by letting the solver play that many turns from a seeded deal, so every run
+# measures the same positions.
+
+PLAYERS = [2, 3, 4]
+JOKERS = [0, 2]
+BOARD_TURNS = [0, 10, 30]
+
+
+def position(num_players, num_jokers, turns, seed=0):
+    # a game after the solver has played turns turns, with the next player's turn started
+    game = Game(num_players=num_players, num_jokers=num_jokers, colors=[Color(c) for c in COLORS],
+                rng=random.Random(seed))
+    policy = SolverPolicy(deadline=0.02)
+    for _ in range(turns):
+        if game.end:
+            break
+        player = game.players[game.current]
+        game.start_turn(player)
+        policy.play_turn(game, player, game.rng)
+        game.finish_turn(player)
+    game.start_turn(game.players[game.current])
+    return game
+
+
+def bench_init(num_players, num_jokers, turns):
+    colors = [Color(c) for c in COLORS]
+    rng = random.Random(0)
+    return lambda: Game(num_players=num_players, num_jokers=num_jokers, colors=colors, rng=rng)
+
+
+def bench_possible_moves(num_players, num_jokers, turns):
+    game = position(num_players, num_jokers, turns)
+    player = game.players[game.current]
+    return lambda: game.possible_moves(player)
+
+
+def bench_make_move(num_players, num_jokers, turns):
+    # apply and undo one move, cycling through the moves available in the position
+    game = position(num_players, num_jokers, turns)
+    player = game.players[game.current]
+    moves = game.possible_moves(player)
+    i = [0]
+
+    def run():
+        move = moves[i[0] % len(moves)]
+        i[0] += 1
+        game.checkpoint()
+        game.make_move(player, move)
+        game.revert()
+    return run
+
+
+def bench_check_board_validity(num_players, num_jokers, turns):
+    game = position(num_players, num_jokers, turns)
+    player = game.players[game.current]
+    return lambda: game.board.check_board_validity(player)
+
+
+def bench_fix_board(num_players, num_jokers, turns):
+    # turns every set back into a temp set, fixes the board and rolls it back, so each call does the same work
+    game = position(num_players, num_jokers, turns)
+    player = game.players[game.current]
+
+    def run():
+        game.checkpoint()
+        game.play_sets(player, [TempSet(s.tiles) for s in game.board.sets], [])
+        game.board.fix_board()
+        game.revert()
+    return run
+
+
+def bench_random_game(num_players, num_jokers, turns):
+    # whole games between random policies. turns doesn't apply, so only the empty board variant is run
+    policies = [RandomPolicy() for _ in range(num_players)]
+    seed = [0]
+
+    def run():
+        seed[0] += 1
+        play_game(policies, seed[0], num_jokers=num_jokers, max_turns=200)
+    return run
+
+
+BENCHMARKS = {
+    'game_init': (bench_init, [0]),
+    'possible_moves': (bench_possible_moves, BOARD_TURNS),
+    'make_move': (bench_make_move, BOARD_TURNS),
+    'check_board_validity': (bench_check_board_validity, BOARD_TURNS),
+    'fix_board': (bench_fix_board, BOARD_TURNS),
+    'random_game': (bench_random_game, [0]),
+}
+
+
+def measure(run, min_time=0.2, repeats=3):
+    # best of repeats timings of at least min_time each, then one traced pass for allocations
+    run()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 10:
+            break
+        number *= 2
+    # calibrated on a tenth of min_time, scaled up so each repeat runs for min_time
+    number = max(1, math.ceil(number * min_time / max(elapsed, 1e-9)))
+    best = float('inf')
+    gc.collect()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        best = min(best, (time.perf_counter() - start) / number)
+
+    traced = min(number, 100)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    for _ in range(traced):
+        run()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    return {
+        'ops_per_sec': 1 / best,
+        'seconds_per_op': best,
+        'retained_blocks_per_op': blocks / traced,
+        'peak_bytes': peak,
+    }
+
+
+def run_benchmarks(names=None, min_time=0.2, players=PLAYERS, jokers=JOKERS):
+    results = []
+    for name, (factory, board_turns) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        for num_players in players:
+            for num_jokers in jokers:
+                for turns in board_turns:
+                    result = measure(factory(num_players, num_jokers, turns), min_time)
+                    result.update(name=name, players=num_players, jokers=num_jokers, board_turns=turns)
+                    print(f'{name:22} players={num_players} jokers={num_jokers} turns={turns:<3} '
+                          f'{result["ops_per_sec"]:12.1f} ops/s {result["retained_blocks_per_op"]:8.1f} blocks/op',
+                          file=sys.stderr)
+                    results.append(result)
+    return results
+
+
+def compare(results, baseline, tolerance=0.1):
+    # results that are more than tolerance slower than the same benchmark in the baseline
+    key = lambda r: (r['name'], r['players'], r['jokers'], r['board_turns'])
+    old = {key(r): r for r in baseline['results']}
+    slower = []
+    for result in results:
+        before = old.get(key(result))
+        if before is not None and result['ops_per_sec'] < before['ops_per_sec'] * (1 - tolerance):
+            slower.append((result, before))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the self-play hot paths")
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run, out of {', '.join(BENCHMARKS)}")
+    parser.add_argument('--out', help="save the results as JSON")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="slowdown that counts as a regression")
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds spent timing each benchmark")
+    parser.add_argument('--players', type=int, nargs='+', default=PLAYERS)
+    parser.add_argument('--jokers', type=int, nargs='+', default=JOKERS)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.names, args.min_time, args.players, args.jokers)
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = compare(results, baseline, args.tolerance)
+        for result, before in slower:
+            print(f'SLOWER {result["name"]} players={result["players"]} jokers={result["jokers"]} '
+                  f'turns={result["board_turns"]}: {before["ops_per_sec"]:.1f} -> {result["ops_per_sec"]:.1f} ops/s')
+        if slower:
+            return 1
+        print(f'no regressions against {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
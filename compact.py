@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+
+# every tile in a game is encoded as a small integer ("code"). codes are laid out in the same order the
+# pouch builds its tiles: for each copy, for each color, numbers 1..13, followed by the jokers. so with the
+# standard 4 colors and 2 jokers, codes 0..103 are the numbered tiles and 104, 105 are the jokers.
+#
+# a "kind" forgets which copy a tile is: kind = color_index * 13 + (number - 1), and all jokers share the
+# last kind. in a CompactState racks and the pouch are bitsets over codes (a python int), and can be turned
+# into count vectors over kinds when an agent only cares about what tiles are there, not which copy.
+#
+# the live game keeps racks and the pouch in these terms too: a Rack is a bitset over codes and the Pouch an
+# array of codes with a count vector over kinds, and their tiles are views built from the game's Tile objects.
+# board sets are still lists of tiles that make_move changes in place. a CompactState is a snapshot of the
+# whole position, taken with Game.snapshot() and put back with Game.restore(), for storing, hashing or shipping
+# it (parallel.py, records.Replay). racks and the pouch copy straight in, the board is walked tile by tile, so
+# the turn loop and search still roll back through the journal instead (journal.py).
+
+NUMBERS = 13
+COPIES = 2
+JOKER_NUMBER = 30
+
+# set types used in the compact board encoding
+GROUP = 0
+RUN = 1
+TEMPSET = 2
+
+
+class TileCodec:
+    def __init__(self, num_colors: int, num_jokers: int):
+        self.num_colors = num_colors
+        self.num_jokers = num_jokers
+        self.num_real_kinds = num_colors * NUMBERS
+        self.joker_kind = self.num_real_kinds
+        self.num_kinds = self.num_real_kinds + 1
+        self.num_tiles = COPIES * self.num_real_kinds + num_jokers
+        # lookup tables, indexed by code
+        self.kind_of = tuple(self._kind(code) for code in range(self.num_tiles))
+        self.number_of = tuple(self.kind_number(k) for k in self.kind_of)
+        self.color_of = tuple(self.kind_color(k) for k in self.kind_of)
+        self.all_tiles_bits = (1 << self.num_tiles) - 1
+
+    def _kind(self, code):
+        if code >= COPIES * self.num_real_kinds:
+            return self.joker_kind
+        return code % self.num_real_kinds
+
+    def encode(self, color_index, number, copy=0):
+        return copy * self.num_real_kinds + color_index * NUMBERS + number - 1
+
+    def joker_code(self, i):
+        return COPIES * self.num_real_kinds + i
+
+    def kind(self, color_index, number):
+        return color_index * NUMBERS + number - 1
+
+    def kind_number(self, kind):
+        if kind == self.joker_kind:
+            return JOKER_NUMBER
+        return kind % NUMBERS + 1
+
+    def kind_color(self, kind):
+        # color index of a kind, or None for the joker
+        if kind == self.joker_kind:
+            return None
+        return kind // NUMBERS
+
+    def is_joker(self, code):
+        return self.kind_of[code] == self.joker_kind
+
+    def codes_to_bits(self, codes):
+        bits = 0
+        for code in codes:
+            bits |= 1 << code
+        return bits
+
+    def bits_to_codes(self, bits):
+        codes = []
+        while bits:
+            low = bits & -bits
+            codes.append(low.bit_length() - 1)
+            bits ^= low
+        return codes
+
+    def counts(self, bits):
+        # count vector over kinds for a bitset of codes
+        counts = [0] * self.num_kinds
+        kind_of = self.kind_of
+        while bits:
+            low = bits & -bits
+            counts[kind_of[low.bit_length() - 1]] += 1
+            bits ^= low
+        return counts
+
+    def value(self, bits):
+        # sum of tile numbers, the same way Player.score counts a rack
+        number_of = self.number_of
+        return sum(number_of[code] for code in self.bits_to_codes(bits))
+
+
+@dataclass
+class CompactState:
+    # one game position. racks and the on_board flags are bitsets over tile codes, the pouch is a tuple of
+    # codes in stack order (top last), since that order decides every draw to come, and the board is a tuple
+    # of (set type, tuple of codes). everything is immutable, so copying a state is just copying these
+    # references.
+    __slots__ = ('racks', 'pouch', 'board', 'on_board', 'in_quarantine', 'first_move', 'rng')
+
+    def __init__(self, racks, pouch, board, on_board, in_quarantine, first_move, rng=None):
+        self.racks = racks
+        self.pouch = pouch
+        self.board = board
+        self.on_board = on_board
+        # bitmasks over players
+        self.in_quarantine = in_quarantine
+        self.first_move = first_move
+        # the state of the game's random stream, or None. it isn't part of the position, so equality and
+        # hashing leave it out
+        self.rng = rng
+
+    def copy(self):
+        return CompactState(self.racks, self.pouch, self.board, self.on_board, self.in_quarantine, self.first_move,
+                            self.rng)
+
+    def __eq__(self, other):
+        if isinstance(other, CompactState):
+            return (self.racks == other.racks and self.pouch == other.pouch and self.board == other.board
+                    and self.on_board == other.on_board and self.in_quarantine == other.in_quarantine
+                    and self.first_move == other.first_move)
+        return False
+
+    def __hash__(self):
+        return hash((self.racks, self.pouch, self.board, self.on_board, self.in_quarantine, self.first_move))
+
+    def __str__(self):
+        return f'(racks: {[bin(r) for r in self.racks]}, pouch: {list(self.pouch)}, board: {self.board})'
@@ -0,0 +1,180 @@
+import functools
+from collections import namedtuple
+from compact import NUMBERS, JOKER_NUMBER
+from meldindex import MIN_SET, MAX_GROUP
+
+# cheap heuristic features of a rack, from its count vector over kinds (see compact.py). the rack's shape is
+# looked at one color and one number at a time: which numbers of a color are there decides how close it is to
+# runs, which colors of a number are there decides how close it is to groups. both only depend on a bitmask
+# of at most 13 bits, so they are read from tables built once, and a rack's features are a sum of table
+# entries, which can be updated for one tile in O(1).
+#
+# a tile can count towards a run and a group at the same time, so the features measure potential, not a
+# partition of the rack into melds like the solver finds.
+
+Features = namedtuple('Features', [
+    'points',           # what the rack costs at the end of the game, jokers counting JOKER_NUMBER
+    'tiles',
+    'jokers',
+    'run_tiles',        # tiles in stretches of MIN_SET or more consecutive numbers of one color
+    'run_partials',     # places one tile short of a run: two in a row, or two with a one number gap
+    'group_tiles',      # tiles of numbers held in MIN_SET or more colors
+    'group_partials',   # numbers held in exactly two colors
+    'duplicates',       # kinds held twice
+])
+
+# weights of Evaluator.value, in points. melds count what they would take off the rack, partials and jokers
+# part of it, and the rack's points are a cost
+WEIGHTS = Features(points=-0.1, tiles=-1.0, jokers=6.0, run_tiles=1.5, run_partials=2.0, group_tiles=1.5,
+                   group_partials=1.5, duplicates=-0.5)
+
+
+def _run_entry(mask):
+    # (run_tiles, run_partials) for the numbers of one color present in mask
+    tiles = 0
+    partials = 0
+    segments = []
+    number = 0
+    while number < NUMBERS:
+        if mask >> number & 1:
+            start = number
+            while number < NUMBERS and mask >> number & 1:
+                number += 1
+            segments.append((start, number - start))
+        else:
+            number += 1
+    for i, (start, length) in enumerate(segments):
+        if length >= MIN_SET:
+            tiles += length
+        elif length == 2:
+            partials += 1
+        elif i + 1 < len(segments) and segments[i + 1][1] == 1 and segments[i + 1][0] == start + 2:
+            # x _ x, two single tiles a joker or the missing number would join
+            partials += 1
+    return tiles, partials
+
+
+def _group_entry(mask, num_colors):
+    present = bin(mask).count('1')
+    if present >= MIN_SET:
+        return min(present, MAX_GROUP, num_colors), 0
+    return 0, int(present == 2)
+
+
+@functools.lru_cache(maxsize=None)
+def _tables(num_colors):
+    runs = tuple(_run_entry(mask) for mask in range(1 << NUMBERS))
+    groups = tuple(_group_entry(mask, num_colors) for mask in range(1 << num_colors))
+    return runs, groups
+
+
+class Evaluator:
+    # features and values of racks given as count vectors, memoized by rack signature in a bounded LRU
+    def __init__(self, codec, maxsize=1 << 16, weights=WEIGHTS):
+        self.codec = codec
+        self.weights = weights
+        self.run_table, self.group_table = _tables(codec.num_colors)
+        self.features = functools.lru_cache(maxsize=maxsize)(self._features)
+        self.value = functools.lru_cache(maxsize=maxsize)(self._value)
+
+    def _features(self, counts):
+        # counts must be a tuple, being the cache key
+        num_colors = self.codec.num_colors
+        run_tiles = run_partials = group_tiles = group_partials = 0
+        for color in range(num_colors):
+            mask = 0
+            for number in range(NUMBERS):
+                if counts[color * NUMBERS + number]:
+                    mask |= 1 << number
+            tiles, partials = self.run_table[mask]
+            run_tiles += tiles
+            run_partials += partials
+        for number in range(NUMBERS):
+            mask = 0
+            for color in range(num_colors):
+                if counts[color * NUMBERS + number]:
+                    mask |= 1 << color
+            tiles, partials = self.group_table[mask]
+            group_tiles += tiles
+            group_partials += partials
+        jokers = counts[self.codec.joker_kind]
+        real = counts[:self.codec.num_real_kinds]
+        points = sum(count * (kind % NUMBERS + 1) for kind, count in enumerate(real)) + jokers * JOKER_NUMBER
+        return Features(points, sum(counts), jokers, run_tiles, run_partials, group_tiles, group_partials,
+                        sum(1 for count in real if count > 1))
+
+    def _value(self, counts):
+        return sum(w * f for w, f in zip(self.weights, self.features(counts)))
+
+    def rack(self, counts=None):
+        # an incrementally updated evaluation of one rack, starting from counts or an empty rack
+        return RackEvaluation(self, counts)
+
+    def cache_info(self):
+        return self.features.cache_info()
+
+
+class RackEvaluation:
+    # the features of a rack kept up to date as tiles come and go: add() and remove() only look up the
+    # tables for the tile's own color and number
+    def __init__(self, evaluator, counts=None):
+        codec = evaluator.codec
+        self.evaluator = evaluator
+        self.joker_kind = codec.joker_kind
+        self.counts = [0] * codec.num_kinds
+        self.color_masks = [0] * codec.num_colors
+        self.number_masks = [0] * NUMBERS
+        self._features = [0] * len(Features._fields)
+        if counts is not None:
+            for kind, count in enumerate(counts):
+                for _ in range(count):
+                    self.add(kind)
+
+    def _change(self, kind, step):
+        f = self._features
+        counts = self.counts
+        f[1] += step
+        if kind == self.joker_kind:
+            counts[kind] += step
+            f[0] += step * JOKER_NUMBER
+            f[2] += step
+            return
+        f[0] += step * (kind % NUMBERS + 1)
+        before = counts[kind]
+        counts[kind] = after = before + step
+        if (before > 1) != (after > 1):
+            f[7] += step
+        if (before > 0) == (after > 0):
+            return
+        # the kind appeared or disappeared, which changes the shape of its color and its number
+        color, number = divmod(kind, NUMBERS)
+        run_table = self.evaluator.run_table
+        group_table = self.evaluator.group_table
+        old_run = run_table[self.color_masks[color]]
+        old_group = group_table[self.number_masks[number]]
+        self.color_masks[color] ^= 1 << number
+        self.number_masks[number] ^= 1 << color
+        new_run = run_table[self.color_masks[color]]
+        new_group = group_table[self.number_masks[number]]
+        f[3] += new_run[0] - old_run[0]
+        f[4] += new_run[1] - old_run[1]
+        f[5] += new_group[0] - old_group[0]
+        f[6] += new_group[1] - old_group[1]
+
+    def add(self, kind):
+        self._change(kind, 1)
+
+    def remove(self, kind):
+        if not self.counts[kind]:
+            raise ValueError(f'no tile of kind {kind} on the rack')
+        self._change(kind, -1)
+
+    def features(self):
+        return Features(*self._features)
+
+    def value(self):
+        return sum(w * f for w, f in zip(self.evaluator.weights, self._features))
+
+    def signature(self):
+        # the cache key Evaluator uses for the same rack
+        return tuple(self.counts)
@@ -1,63 +1,142 @@
 import tkinter as tk
 from PIL import Image, ImageTk
+from functools import lru_cache
 import os
 
+# tile images are decoded and scaled once per (color, number, size), and each BoardCanvas keeps the PhotoImages
+# it has made for as long as it lives, since Tk drops an image nobody holds a reference to even while it is
+# on the canvas, and an image belongs to the Tk root it was made under. the board is one Canvas whose image
+# items are reused between redraws. each board row remembers which tiles it shows, so a
+# redraw only touches the rows that changed.
+
+ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+
+# Set the desired width and height
+TILE_WIDTH = 53
+TILE_HEIGHT = 76
+PADDING = 10
+
 class Tile:
     def __init__(self, color, number):
         self.color = color
         self.number = number
 
+def tile_key(tile):
+    # jokers are drawn from None-30.png whatever color object the game gave them
+    if getattr(tile, 'is_joker', False):
+        return ("None", 30)
+    return (str(tile.color), tile.number)
+
+@lru_cache(maxsize=None)
+def load_image(color, number):
+    # the decoded asset, read from disk only once
+    path = os.path.join(ASSETS, f"{color}-{number}.png")
+    image = Image.open(path)
+    image.load()
+    return image
+
+@lru_cache(maxsize=256)
+def scaled_image(color, number, width=TILE_WIDTH, height=TILE_HEIGHT):
+    # the asset scaled to a tile's size. a plain PIL image, so it isn't tied to any Tk root
+    return load_image(color, number).resize((width, height), Image.LANCZOS)
+
 def drag_start(event):
-    widget = event.widget
-    widget.startX = event.x
-    widget.startY = event.y
+    canvas = event.widget
+    canvas.dragged = canvas.find_withtag("current")
+    canvas.startX = event.x
+    canvas.startY = event.y
 
 def drag_motion(event):
-    widget = event.widget
-    x = widget.winfo_x() - widget.startX + event.x
-    y = widget.winfo_y() - widget.startY + event.y
-    widget.place(x=x, y=y)
-
-def resize_image(image_path, width, height):
-    original_image = Image.open(image_path)
-    resized_image = original_image.resize((width, height), Image.LANCZOS)
-    return ImageTk.PhotoImage(resized_image)
-
-def create_new_label(root, image, tile, tiles):
-    label = tk.Label(root, image=image)
-    label.grid(row=0, column=tiles.index(tile), padx=10, pady=10)
-    label.bind("<Button-1>", drag_start)
-    label.bind("<B1-Motion>", drag_motion)
-    return label
-    
+    canvas = event.widget
+    if not canvas.dragged:
+        return
+    canvas.move(canvas.dragged, event.x - canvas.startX, event.y - canvas.startY)
+    canvas.startX = event.x
+    canvas.startY = event.y
+
+class BoardCanvas:
+    # draws rows of tiles (the board's sets, then the rack) on a single canvas
+    def __init__(self, root, width=1000, height=700, tile_width=TILE_WIDTH, tile_height=TILE_HEIGHT):
+        self.canvas = tk.Canvas(root, width=width, height=height)
+        self.canvas.pack(fill="both", expand=True)
+        self.canvas.dragged = ()
+        self.canvas.tag_bind("tile", "<Button-1>", drag_start)
+        self.canvas.tag_bind("tile", "<B1-Motion>", drag_motion)
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.tiles_per_line = max(1, (width - PADDING) // (tile_width + PADDING))
+        # per row, the tile keys it shows and the canvas items showing them
+        self.rows = []
+        self.items = []
+        # tile key -> PhotoImage. there are only a few dozen kinds of tile, so none are ever thrown away
+        self.images = {}
+
+    def tile_image(self, color, number):
+        image = self.images.get((color, number))
+        if image is None:
+            scaled = scaled_image(color, number, self.tile_width, self.tile_height)
+            image = self.images[(color, number)] = ImageTk.PhotoImage(scaled, master=self.canvas)
+        return image
+
+    def position(self, row, column):
+        # rows that don't fit on one line wrap onto the next
+        line = sum(self.lines(len(keys)) for keys in self.rows[:row]) + column // self.tiles_per_line
+        column %= self.tiles_per_line
+        return (PADDING + column * (self.tile_width + PADDING), PADDING + line * (self.tile_height + PADDING))
+
+    def lines(self, length):
+        return max(1, -(-length // self.tiles_per_line))
+
+    def draw(self, rows):
+        # rows is a list of lists of tiles. rows that show the same tiles as last time are left alone, unless
+        # a row above them changed how many lines it takes
+        rows = [tuple(tile_key(tile) for tile in row) for row in rows]
+        moved = False
+        for r, keys in enumerate(rows):
+            if r < len(self.rows):
+                if keys == self.rows[r] and not moved:
+                    continue
+                moved = moved or self.lines(len(keys)) != self.lines(len(self.rows[r]))
+                self.rows[r] = keys
+            else:
+                self.rows.append(keys)
+                self.items.append([])
+            self.draw_row(r)
+        for r in range(len(rows), len(self.rows)):
+            for item in self.items[r]:
+                self.canvas.delete(item)
+        del self.rows[len(rows):]
+        del self.items[len(rows):]
+
+    def draw_row(self, r):
+        items = self.items[r]
+        keys = self.rows[r]
+        for column, (color, number) in enumerate(keys):
+            image = self.tile_image(color, number)
+            x, y = self.position(r, column)
+            if column < len(items):
+                self.canvas.itemconfigure(items[column], image=image)
+                self.canvas.coords(items[column], x, y)
+            else:
+                items.append(self.canvas.create_image(x, y, image=image, anchor="nw", tags=("tile",)))
+        for item in items[len(keys):]:
+            self.canvas.delete(item)
+        del items[len(keys):]
+
+    def draw_game(self, game, player):
+        # the board's sets, one per row, followed by the player's rack
+        self.draw([s.tiles for s in game.board.sets] + [player.rack.tiles])
+
 def main(tiles):
     root = tk.Tk()
     root.geometry("1000x700")
     root.title("Rummikub")
 
-    # Set the desired width and height
-    new_width = 53
-    new_height = 76
-    
-    
-
-
-    imgs = []
-    for tile in tiles:
-        # Replace 'your_image.jpg' with the path to your image file
-        img_path = f"/{tile.color}-{tile.number}.png"
-        path = os.getcwd() + "/assets" + img_path
-
-        # Resize the image
-        resized_image = resize_image(path, new_width, new_height)
-        imgs.append(resized_image)
-        create_new_label(root, resized_image, tile, tiles)
-        #tk.Label(root, image=imgs[-1], width=new_width, height=new_height).grid()
-        # Create a label to display the resized image
-        #labels.append(create_new_label(root, resized_image, tile, tiles))
+    board = BoardCanvas(root)
+    board.draw([tiles])
 
     root.mainloop()
 
 if __name__ == "__main__":
-    tiles = [Tile("red", 1), Tile("blue", 2), Tile("green", 3)]  # Replace with your tile data
+    tiles = [Tile("red", 1), Tile("blue", 2), Tile("orange", 3)]  # Replace with your tile data
     main(tiles)
@@ -0,0 +1,150 @@
+from dataclasses import dataclass
+
+# every change make_move and fix_board do to a game is one of these primitive operations. each journal entry
+# is a tuple (op, ...) holding just enough to put things back the way they were.
+REMOVE_SET = 0      # (REMOVE_SET, index, set) a set was removed from board.sets at index
+APPEND_SET = 1      # (APPEND_SET,) a set was appended to board.sets
+REPLACE_SET = 2     # (REPLACE_SET, index, old_set) board.sets[index] was replaced
+INSERT_TILE = 3     # (INSERT_TILE, set, pos) a tile was inserted into set.tiles at pos
+RACK_REMOVE = 4     # (RACK_REMOVE, rack, tile) a tile was taken off a rack
+RACK_ADD = 5        # (RACK_ADD, rack, tile) a tile was put on a rack
+POUCH_REMOVE = 6    # (POUCH_REMOVE, pouch, index, tile) a tile was removed from the pouch's stack at index
+SET_ATTR = 7        # (SET_ATTR, obj, name, old_value) an attribute (first_move, on_board, ...) was changed
+
+
+@dataclass
+class Journal:
+    def __init__(self):
+        self.entries = []
+        # stack of checkpoints, each one the length of entries when it was taken
+        self.marks = []
+        # the length of entries when each move started, for undo and redo by move
+        self.moves = []
+        # per move undone, most recently undone last, its entries and what each one took away when it was
+        # undone, so redo can put back the very same objects rather than making the move again
+        self.undone = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record(self, entry):
+        if self.marks:
+            self.entries.append(entry)
+
+    def begin_move(self):
+        # marks the start of a move. a new move forgets the moves that could be redone
+        if self.marks:
+            self.moves.append(len(self.entries))
+            self.undone.clear()
+
+    def undoable(self):
+        # the moves made since the last checkpoint, which undo can take back
+        if not self.marks:
+            return 0
+        mark = self.marks[-1]
+        count = 0
+        for start in reversed(self.moves):
+            if start < mark:
+                break
+            count += 1
+        return count
+
+    def checkpoint(self):
+        self.marks.append(len(self.entries))
+        self.undone.clear()
+        return len(self.marks)
+
+    def commit(self):
+        # keep every change made since the last checkpoint. once the outermost checkpoint is committed
+        # there is nothing left to roll back to, so the entries can go.
+        self.marks.pop()
+        self.undone.clear()
+        if not self.marks:
+            self.clear()
+
+    def revert(self, board):
+        # undo every change made since the last checkpoint, newest first
+        mark = self.marks.pop()
+        self._undo_to(board, mark)
+        self.undone.clear()
+        if not self.marks:
+            self.clear()
+
+    def undo(self, board, n=1):
+        # undo the last n moves, along with anything recorded after them (fix_board, attribute changes).
+        # only moves made since the last checkpoint can be undone
+        if n > self.undoable():
+            raise ValueError(f'can\'t undo {n} moves, {self.undoable()} made since the last checkpoint')
+        for _ in range(n):
+            undone = []
+            self._undo_to(board, self.moves.pop(), undone)
+            self.undone.append(undone)
+
+    def redo(self, board, n=1):
+        # makes again the last n moves undone, by doing what their entries undid, newest entry last
+        if n > len(self.undone):
+            raise ValueError(f'can\'t redo {n} moves, {len(self.undone)} undone')
+        entries = self.entries
+        sets = board.sets
+        for _ in range(n):
+            self.moves.append(len(entries))
+            for entry, taken in reversed(self.undone.pop()):
+                op = entry[0]
+                if op == REMOVE_SET:
+                    sets.pop(entry[1])
+                elif op == APPEND_SET:
+                    sets.append(taken)
+                elif op == REPLACE_SET:
+                    sets[entry[1]] = taken
+                elif op == INSERT_TILE:
+                    entry[1].tiles.insert(entry[2], taken)
+                elif op == RACK_REMOVE:
+                    entry[1].remove(entry[2])
+                elif op == RACK_ADD:
+                    entry[1].add(entry[2])
+                elif op == POUCH_REMOVE:
+                    entry[1].remove(entry[3])
+                elif op == SET_ATTR:
+                    setattr(entry[1], entry[2], taken)
+                entries.append(entry)
+
+    def clear(self):
+        self.entries.clear()
+        self.marks.clear()
+        self.moves.clear()
+        self.undone.clear()
+
+    def _undo_to(self, board, length, undone=None):
+        # with undone, also keeps each entry with the set, tile or value undoing it took away, for redo
+        entries = self.entries
+        sets = board.sets
+        moves = self.moves
+        while moves and moves[-1] >= length:
+            moves.pop()
+        while len(entries) > length:
+            entry = entries.pop()
+            op = entry[0]
+            taken = None
+            if op == REMOVE_SET:
+                sets.insert(entry[1], entry[2])
+            elif op == APPEND_SET:
+                taken = sets.pop()
+            elif op == REPLACE_SET:
+                taken = sets[entry[1]]
+                sets[entry[1]] = entry[2]
+            elif op == INSERT_TILE:
+                taken = entry[1].tiles.pop(entry[2])
+            elif op == RACK_REMOVE:
+                entry[1].add(entry[2])
+            elif op == RACK_ADD:
+                entry[1].remove(entry[2])
+            elif op == POUCH_REMOVE:
+                entry[1].put_back(entry[2], entry[3])
+            elif op == SET_ATTR:
+                taken = getattr(entry[1], entry[2])
+                setattr(entry[1], entry[2], entry[3])
+            if undone is not None:
+                undone.append((entry, taken))
+
+    def __str__(self):
+        return f'(entries: {len(self.entries)}, moves: {len(self.moves)}, checkpoints: {self.marks})'
@@ -0,0 +1,326 @@
+import math
+import time
+import random
+from dataclasses import dataclass
+from rummikub import Split, Add, PickTile
+from selfplay import SolverPolicy
+from solver import best_play
+from evaluation import Evaluator
+
+# monte carlo tree search over the moves of a player's own turns. the other players' racks are hidden, so every
+# simulation first deals them a fresh sample of the tiles the searching player can't see (determinization),
+# then plays the tree moves, ends the turn, lets everyone else play a turn with a fast rollout policy, and
+# carries on into the player's next turn until the turn limit or a node that hasn't been expanded yet. at the
+# start of each turn, playing the solver's best rearrangement in one go is offered next to the single moves.
+#
+# nothing is copied: a simulation opens a checkpoint on the game's journal, and everything it does, dealing
+# the sampled racks included, is undone with one revert at the end.
+#
+# nodes live in a transposition table keyed by a zobrist-style hash of the board and the player's rack, so
+# the same position reached by different move orders shares statistics, and the table is kept between turns.
+
+DONE = ('done',)
+PICK = ('pick',)
+# at the start of a turn the solver's best play is one more move the tree can choose
+SOLVE = ('solve',)
+
+
+def move_key(game, player, move):
+    # a description of a move that doesn't depend on object identity, so it means the same thing after the
+    # game is reverted and replayed, or in another process
+    kind_of = game.codec.kind_of
+    if isinstance(move, PickTile):
+        return PICK
+    if isinstance(move, Split):
+        s = move.to_split
+        return ('split', type(s).__name__, tuple(kind_of[tile.code] for tile in s.tiles), move.split_at)
+    if isinstance(move, Add):
+        s = move.set_to_add
+        from_rack = player.rack.has(move.tile)
+        return ('add', from_rack, kind_of[move.tile.code], type(s).__name__,
+                tuple(kind_of[tile.code] for tile in s.tiles), move.pos_to_add == 0)
+    return DONE
+
+
+def position_key(game, player):
+    # the position the transposition table hashes (the board as a multiset of sets, the player's rack and
+    # turn flags), spelled out so it means the same thing in another process
+    kind_of = game.codec.kind_of
+    board = sorted((type(s).__name__, tuple(kind_of[tile.code] for tile in s.tiles)) for s in game.board.sets)
+    rack = sorted(kind_of[tile.code] for tile in player.rack.tiles)
+    return tuple(board), tuple(rack), player.first_move, player.in_quarantine
+
+
+@dataclass
+class Node:
+    def __init__(self, keys):
+        self.visits = 0
+        # move key -> [visits, total value]
+        self.edges = {key: [0, 0.0] for key in keys}
+
+    def __str__(self):
+        return f'(visits: {self.visits}, moves: {len(self.edges)})'
+
+
+class MCTSPolicy:
+    def __init__(self, iterations=None, time_limit=1.0, max_turns=2, max_moves=12, exploration=1.4,
+                 rollout_policy=None, max_nodes=200000, seed=None, heuristic=False):
+        # stops after iterations simulations or time_limit seconds, whichever comes first
+        self.iterations = iterations
+        self.time_limit = time_limit
+        # how many of its own turns a simulation plays, and how many moves it makes in one turn
+        self.max_turns = max_turns
+        self.max_moves = max_moves
+        self.exploration = exploration
+        self.rollout_policy = rollout_policy if rollout_policy is not None else SolverPolicy(deadline=0.005)
+        self.solver_deadline = 0.01
+        # moves tried fewer times than this aren't trusted enough to be played
+        self.min_visits = 2
+        self.max_nodes = max_nodes
+        # score positions that aren't won yet by evaluation.py's rack features instead of rack points
+        self.heuristic = heuristic
+        self.evaluator = None
+        self.rng = random.Random(seed)
+        self.table = {}
+        self._set_hashes = {}
+        self._rack_hashes = {}
+
+    def __str__(self):
+        return 'mcts'
+
+    def _hash(self, game, player):
+        # sum of one random number per set (so identical sets don't cancel out like they would with xor),
+        # xor of one random number per rack tile, and the player's turn flags
+        kind_of = game.codec.kind_of
+        rng = self.rng
+        h = 0
+        for s in game.board.sets:
+            key = (type(s), tuple(kind_of[tile.code] for tile in s.tiles))
+            set_hash = self._set_hashes.get(key)
+            if set_hash is None:
+                set_hash = self._set_hashes[key] = rng.getrandbits(64)
+            h += set_hash
+        h &= (1 << 64) - 1
+        seen = {}
+        for tile in player.rack.tiles:
+            kind = kind_of[tile.code]
+            copy = seen[kind] = seen.get(kind, -1) + 1
+            tile_hash = self._rack_hashes.get((kind, copy))
+            if tile_hash is None:
+                tile_hash = self._rack_hashes[(kind, copy)] = rng.getrandbits(64)
+            h ^= tile_hash
+        return (h, player.first_move, player.in_quarantine)
+
+    def _determinize(self, game, player):
+        # deal the other players a random sample of the tiles this player can't see, through the journal
+        hidden = list(game.pouch.tiles)
+        others = [p for p in game.players if p is not player]
+        for other in others:
+            hidden.extend(other.rack.tiles)
+        self.rng.shuffle(hidden)
+        for other in others:
+            size = len(other.rack)
+            game.set_attr(other.rack, 'tiles', hidden[:size])
+            hidden = hidden[size:]
+        game.set_attr(game.pouch, 'tiles', hidden)
+
+    def _evaluate(self, game, player):
+        # +1 for a win, -1 for a loss, otherwise how far ahead the player is on rack points (or on the rack
+        # features of evaluation.py, with heuristic), squashed
+        index = next(i for i, p in enumerate(game.players) if p is player)
+        if game.winner is not None:
+            return 1.0 if game.winner == index else -1.0
+        if self.heuristic:
+            if self.evaluator is None:
+                self.evaluator = Evaluator(game.codec)
+            value = self.evaluator.value
+            own = value(tuple(player.rack.counts()))
+            others = [value(tuple(p.rack.counts())) for p in game.players if p is not player]
+            return math.tanh((own - sum(others) / len(others)) / 20)
+        own = sum(tile.number for tile in player.rack.tiles)
+        others = [sum(tile.number for tile in p.rack.tiles) for p in game.players if p is not player]
+        return math.tanh((sum(others) / len(others) - own) / 50)
+
+    def _other_turns(self, game, player):
+        # everyone else plays one turn with the rollout policy
+        while not game.end and game.players[game.current] is not player:
+            other = game.players[game.current]
+            game.start_turn(other)
+            self.rollout_policy.play_turn(game, other, self.rng)
+            game.finish_turn(other)
+
+    def _select(self, node, moves):
+        log_visits = math.log(node.visits + 1)
+        # unvisited single moves get the node's average value and no exploration bonus (first play urgency),
+        # so they are only tried once the moves tried so far look worse than average, and the visits go to
+        # the good lines instead of being spread over every move. ending the turn, drawing and the solver's
+        # play are always tried first
+        urgency = sum(total for _, total in node.edges.values()) / node.visits if node.visits else 0.0
+        best = None
+        best_score = -math.inf
+        for key, (visits, total) in node.edges.items():
+            if key not in moves and key != DONE:
+                continue
+            if visits == 0:
+                score = math.inf if key in (DONE, PICK, SOLVE) else urgency
+            else:
+                score = total / visits + self.exploration * math.sqrt(log_visits / visits)
+            # random tie break so unvisited moves are tried in a random order
+            score += self.rng.random() * 1e-6
+            if score > best_score:
+                best, best_score = key, score
+        return best
+
+    def _moves(self, game, player, moves_made):
+        # move key -> move for everything that can be done from here
+        if moves_made >= self.max_moves:
+            return {}
+        moves = {move_key(game, player, move): move for move in game.iter_moves(player)}
+        if moves_made == 0:
+            moves[SOLVE] = None
+        return moves
+
+    def _solve(self, game, player, deadline):
+        solution = best_play(game, player, deadline)
+        if solution is not None:
+            game.play_sets(player, solution.sets, solution.played)
+
+    def _finish_turn(self, game, player, valid_at):
+        # ends the turn the way play_line does: moves after the last valid board are undone first, so a good
+        # play followed by a move that breaks the board still counts as the good play
+        if not game.board.check_board_validity(player):
+            game.undo(len(game.journal.moves) - valid_at)
+        game.finish_turn(player)
+
+    def _simulate(self, game, player):
+        game.checkpoint()
+        self._determinize(game, player)
+        path = []
+        turns = 0
+        moves_made = 0
+        game.start_turn(player)
+        valid_at = len(game.journal.moves)
+        while True:
+            h = self._hash(game, player)
+            node = self.table.get(h)
+            moves = self._moves(game, player, moves_made)
+            if node is None:
+                # a new position: add it to the tree and score it by ending the turn here
+                self.table[h] = Node(list(moves) + [DONE])
+                self._finish_turn(game, player, valid_at)
+                self._other_turns(game, player)
+                value = self._evaluate(game, player)
+                break
+            key = self._select(node, moves)
+            path.append((node, key))
+            if key == DONE or key == PICK:
+                if key == PICK:
+                    game.make_move(player, moves[key])
+                    valid_at = len(game.journal.moves)
+                self._finish_turn(game, player, valid_at)
+                self._other_turns(game, player)
+                turns += 1
+                if game.end or turns >= self.max_turns:
+                    value = self._evaluate(game, player)
+                    break
+                game.start_turn(player)
+                valid_at = len(game.journal.moves)
+                moves_made = 0
+                continue
+            if key == SOLVE:
+                self._solve(game, player, self.solver_deadline)
+            else:
+                game.make_move(player, moves[key])
+            moves_made += 1
+            if game.board.check_board_validity(player):
+                valid_at = len(game.journal.moves)
+        for node, key in path:
+            node.visits += 1
+            edge = node.edges[key]
+            edge[0] += 1
+            edge[1] += value
+        game.revert()
+
+    def search(self, game, player):
+        # runs simulations from the start of player's turn and returns the root node
+        if len(self.table) > self.max_nodes:
+            self.table.clear()
+        stop_at = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        iterations = 0
+        while True:
+            if self.iterations is not None and iterations >= self.iterations:
+                break
+            if stop_at is not None and time.perf_counter() > stop_at:
+                break
+            self._simulate(game, player)
+            iterations += 1
+        return self.table.get(self._hash(game, player))
+
+    def turn_stats(self, game, player):
+        # the statistics of every position the search reached within this turn, as position_key ->
+        # {move key: [visits, total value]}. keys don't depend on object identity or on this policy's hashes,
+        # so statistics from searches in different processes can be added up. they are keyed by position
+        # rather than by the moves that led there since a solver play cut short by its deadline can come out
+        # differently every time
+        stats = {}
+        self._collect(game, player, 0, stats)
+        return stats
+
+    def _collect(self, game, player, moves_made, stats):
+        node = self.table.get(self._hash(game, player))
+        position = position_key(game, player)
+        if node is None or position in stats:
+            return
+        stats[position] = {key: list(edge) for key, edge in node.edges.items() if edge[0]}
+        moves = self._moves(game, player, moves_made)
+        for key, (visits, _) in node.edges.items():
+            if visits < self.min_visits or key == DONE or key == PICK or key not in moves:
+                continue
+            game.checkpoint()
+            if key == SOLVE:
+                self._solve(game, player, self.solver_deadline)
+            else:
+                game.make_move(player, moves[key])
+            self._collect(game, player, moves_made + 1, stats)
+            game.revert()
+
+    def play_turn(self, game, player, rng):
+        # searches from the start of the turn, then plays the most visited line
+        self.search(game, player)
+
+        def edges():
+            node = self.table.get(self._hash(game, player))
+            return None if node is None else node.edges
+        self.play_line(game, player, edges)
+
+    def play_line(self, game, player, edges):
+        # plays the most visited move from edges(), the statistics of the position the game is in, until they
+        # say the turn is over or get to moves the search barely looked at. statistics are looked up by
+        # position after every move, so a solver play that comes out differently from the ones in the
+        # simulations just finds the statistics of the board it did make, if any. if the line leaves the board
+        # invalid, the moves after the last valid board are undone, rather than losing the whole turn
+        valid_at = len(game.journal.moves)
+        moves_made = 0
+        for _ in range(self.max_moves):
+            stats = edges()
+            if not stats:
+                break
+            key, (visits, _) = max(stats.items(), key=lambda item: (item[1][0], item[1][1]))
+            if visits < self.min_visits or key == DONE:
+                break
+            moves = self._moves(game, player, moves_made)
+            if key not in moves:
+                break
+            if key == SOLVE:
+                # the real play gets more time than the ones in the simulations, so it may find a different
+                # board. that's fine, since the next move is looked up from whatever board it made
+                self._solve(game, player, self.solver_deadline * 10)
+            else:
+                game.make_move(player, moves[key])
+            if key == PICK:
+                break
+            moves_made += 1
+            if game.board.check_board_validity(player):
+                valid_at = len(game.journal.moves)
+        if not game.board.check_board_validity(player):
+            game.undo(len(game.journal.moves) - valid_at)
@@ -0,0 +1,126 @@
+import os
+import pickle
+import functools
+from dataclasses import dataclass
+from compact import NUMBERS
+
+# a table of every legal run and group for a number of colors and jokers, so checking a set is a dict lookup
+# on the kinds of its tiles (see compact.py) instead of walking the tiles. the table is built the first time
+# it is asked for and pickled to disk, so later processes only have to load it.
+
+MIN_SET = 3
+MAX_GROUP = 4
+VERSION = 2
+
+
+@dataclass
+class MeldIndex:
+    def __init__(self, num_colors: int, num_jokers: int):
+        self.num_colors = num_colors
+        self.num_jokers = num_jokers
+        joker = num_colors * NUMBERS
+        # ordered kinds of a run -> its points, with jokers worth the tile they stand in for
+        self.runs = {}
+        # sorted kinds of a group -> its points. tile order doesn't matter in a group
+        self.groups = {}
+        # multiset signature (sorted kinds) -> every (is_run, points, kinds) that can be made from those tiles
+        self.by_signature = {}
+        # partial sets that can still grow into a run (ordered) or a group (sorted), used to prune moves
+        self.run_fragments = set()
+        self.group_fragments = set()
+
+        for color in range(num_colors):
+            for length in range(MIN_SET, NUMBERS + 1):
+                for start in range(1, NUMBERS - length + 2):
+                    base = [color * NUMBERS + number - 1 for number in range(start, start + length)]
+                    points = sum(range(start, start + length))
+                    for kinds in self._with_jokers(base, joker):
+                        self.runs[kinds] = points
+                        self._add(True, points, kinds)
+                        for i in range(length):
+                            for j in range(i + 1, length + 1):
+                                self.run_fragments.add(kinds[i:j])
+
+        group_size = min(MAX_GROUP, num_colors)
+        for number in range(1, NUMBERS + 1):
+            for colors in range(1, 1 << num_colors):
+                real = [color * NUMBERS + number - 1 for color in range(num_colors) if colors >> color & 1]
+                for jokers in range(min(num_jokers, group_size - 1) + 1):
+                    size = len(real) + jokers
+                    if MIN_SET <= size <= group_size:
+                        kinds = tuple(real + [joker] * jokers)
+                        self.groups[kinds] = number * size
+                        self._add(False, number * size, kinds)
+                    if 0 < size <= group_size:
+                        self.group_fragments.add(tuple(real + [joker] * jokers))
+
+    def _with_jokers(self, base, joker):
+        # every way of swapping some of the tiles of a run for jokers, keeping at least one real tile
+        length = len(base)
+        for mask in range(1 << length):
+            jokers = bin(mask).count('1')
+            if jokers > self.num_jokers or jokers == length:
+                continue
+            yield tuple(joker if mask >> i & 1 else kind for i, kind in enumerate(base))
+
+    def _add(self, is_run, points, kinds):
+        self.by_signature.setdefault(tuple(sorted(kinds)), []).append((is_run, points, kinds))
+
+    def run_value(self, kinds):
+        # points of a run with these kinds in this order, or None if it isn't one
+        return self.runs.get(tuple(kinds))
+
+    def group_value(self, kinds):
+        return self.groups.get(tuple(sorted(kinds)))
+
+    def is_fragment(self, kinds, is_run=None):
+        # whether these tiles, in this order, could still become a run (is_run True), a group (is_run
+        # False) or either (is_run None) by adding tiles at the ends
+        if is_run is not False and tuple(kinds) in self.run_fragments:
+            return True
+        if is_run is not True and tuple(sorted(kinds)) in self.group_fragments:
+            return True
+        return False
+
+    def meld_value(self, kinds):
+        # (is_run, points) for a set that could be either, or None. a set that is both, like two jokers and
+        # a 5, counts as whichever is worth more
+        run = self.run_value(kinds)
+        group = self.group_value(kinds)
+        if run is None and group is None:
+            return None
+        if group is None or (run is not None and run >= group):
+            return True, run
+        return False, group
+
+    def __len__(self):
+        return len(self.runs) + len(self.groups)
+
+    def __str__(self):
+        return f'(colors: {self.num_colors}, jokers: {self.num_jokers}, runs: {len(self.runs)}, groups: {len(self.groups)})'
+
+
+def cache_dir():
+    return os.environ.get('RUMMIKUB_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'rummikub'))
+
+
+@functools.lru_cache(maxsize=None)
+def meld_index(num_colors, num_jokers):
+    path = os.path.join(cache_dir(), f'melds-{num_colors}-{num_jokers}-v{VERSION}.pickle')
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+    index = MeldIndex(num_colors, num_jokers)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so a worker never loads a half written table
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except OSError:
+        # a read-only home directory just means building the table every run
+        pass
+    return index
@@ -0,0 +1,96 @@
+from meldindex import meld_index
+from rummikub import Group, Run, TempSet, Split, Add, PickTile
+
+# lazy move generation. only adds that leave the set something that can still become a run or group are
+# produced, and duplicate moves (two copies of a tile, two identical sets) are dropped with a hash set.
+#
+# what can be done with a set only depends on its type and the kinds of its tiles, so that is worked out once
+# per distinct set and kept. after a move only the sets it touched look different, so every other set is a
+# cache hit the next time moves are generated.
+
+RUN_SET = True
+GROUP_SET = False
+ANY_SET = None
+
+
+class MoveGenerator:
+    def __init__(self, game):
+        self.game = game
+        self.index = meld_index(game.codec.num_colors, game.codec.num_jokers)
+        self.kind_of = game.codec.kind_of
+        # (set type, kinds) -> {(kind, front): bool}
+        self._adds = {}
+
+    def _set_type(self, s):
+        if isinstance(s, Run):
+            return RUN_SET
+        if isinstance(s, Group):
+            return GROUP_SET
+        return ANY_SET
+
+    def can_add(self, set_type, kinds, kind, front):
+        # whether adding a tile of this kind at the front or back of a set leaves something that can still
+        # become a valid set
+        key = (set_type, kinds)
+        adds = self._adds.get(key)
+        if adds is None:
+            adds = self._adds[key] = {}
+        result = adds.get((kind, front))
+        if result is None:
+            new_kinds = (kind,) + kinds if front else kinds + (kind,)
+            result = adds[(kind, front)] = self.index.is_fragment(new_kinds, set_type)
+        return result
+
+    def moves(self, player):
+        # yields moves one at a time, so search code can stop as soon as it has what it needs
+        game = self.game
+        kind_of = self.kind_of
+        if player.first_move:
+            yield PickTile(game.pouch)
+
+        sets = []
+        seen_sets = set()
+        for s in game.board.sets:
+            kinds = tuple(kind_of[tile.code] for tile in s.tiles)
+            set_type = self._set_type(s)
+            sets.append((s, set_type, kinds))
+            # splitting sets. splitting either of two identical sets has the same result
+            if (set_type, kinds) in seen_sets:
+                continue
+            seen_sets.add((set_type, kinds))
+            for split_at in range(1, len(kinds)):
+                yield Split(s, split_at)
+
+        # tiles that can be added to a set: the player's rack and single tiles left on the board
+        sources = []
+        seen_tiles = set()
+        for tile in player.rack.tiles:
+            if (True, kind_of[tile.code]) not in seen_tiles:
+                seen_tiles.add((True, kind_of[tile.code]))
+                sources.append((tile, True))
+        for s, _, kinds in sets:
+            if len(kinds) == 1 and (False, kinds[0]) not in seen_tiles:
+                seen_tiles.add((False, kinds[0]))
+                sources.append((s.tiles[0], False))
+
+        seen_moves = set()
+        for tile, from_rack in sources:
+            kind = kind_of[tile.code]
+            for s, set_type, kinds in sets:
+                if len(kinds) == 1 and s.tiles[0] is tile:
+                    continue
+                # the order of a group doesn't matter, so only add to its back
+                for front in ((False,) if set_type is GROUP_SET else (True, False)):
+                    key = (from_rack, kind, set_type, kinds, front)
+                    if key in seen_moves:
+                        continue
+                    seen_moves.add(key)
+                    if self.can_add(set_type, kinds, kind, front):
+                        yield Add(tile, s, 0 if front else len(kinds))
+
+        for tile, from_rack in sources:
+            if from_rack:
+                yield Add(tile, TempSet([]), 0)
+
+    def __str__(self):
+        return f'(cached sets: {len(self._adds)})'
@@ -0,0 +1,170 @@
+import numpy as np
+from rummikub import Group, Run, TempSet, Split, Add, PickTile
+
+# fixed-shape numpy encoding of game positions for training. a batch of games is written into stacked arrays
+# in one call, optionally into buffers the caller allocated once and keeps reusing.
+#
+# tiles are encoded by kind (see compact.py), so the two copies of a tile look the same. board slots hold
+# kind + 1, with 0 meaning an empty slot.
+
+MAX_SETS = 40
+MAX_SET_LENGTH = 13
+MAX_PLAYERS = 4
+
+# set type codes in the set_types array, 0 being an empty slot
+SET_TYPE_CODES = {Group: 1, Run: 2, TempSet: 3}
+
+
+class ActionSpace:
+    # every move a player can make, numbered. the layout is
+    #   PICK                                       draw a tile
+    #   DONE                                       end the turn
+    #   split set s at position p                  max_sets * (max_set_length - 1)
+    #   add a rack tile of kind k to set s         num_kinds * max_sets * 2 (front, back)
+    #   add the single tile of set a to set s      max_sets * max_sets * 2 (front, back)
+    #   put a rack tile of kind k down on its own  num_kinds
+    PICK = 0
+    DONE = 1
+
+    def __init__(self, num_kinds, max_sets=MAX_SETS, max_set_length=MAX_SET_LENGTH):
+        self.num_kinds = num_kinds
+        self.max_sets = max_sets
+        self.max_set_length = max_set_length
+        self.split_offset = 2
+        self.add_rack_offset = self.split_offset + max_sets * (max_set_length - 1)
+        self.add_board_offset = self.add_rack_offset + num_kinds * max_sets * 2
+        self.new_set_offset = self.add_board_offset + max_sets * max_sets * 2
+        self.size = self.new_set_offset + num_kinds
+
+    def split(self, s, pos):
+        return self.split_offset + s * (self.max_set_length - 1) + pos - 1
+
+    def add_rack(self, kind, s, back):
+        return self.add_rack_offset + (kind * self.max_sets + s) * 2 + back
+
+    def add_board(self, source, s, back):
+        return self.add_board_offset + (source * self.max_sets + s) * 2 + back
+
+    def new_set(self, kind):
+        return self.new_set_offset + kind
+
+    def encode(self, game, player, move):
+        # action number of a move, or None if it doesn't fit in the fixed action space
+        kind_of = game.codec.kind_of
+        sets = game.board.sets
+        if isinstance(move, PickTile):
+            return self.PICK
+        if isinstance(move, Split):
+            s = game.board.find_set(move.to_split)
+            if s >= self.max_sets or move.split_at >= self.max_set_length:
+                return None
+            return self.split(s, move.split_at)
+        if isinstance(move, Add):
+            kind = kind_of[move.tile.code]
+            from_rack = player.rack.has(move.tile)
+            if not move.set_to_add.tiles:
+                return self.new_set(kind) if from_rack else None
+            s = game.board.find_set(move.set_to_add)
+            back = int(move.pos_to_add != 0)
+            if s >= self.max_sets or len(sets[s].tiles) >= self.max_set_length:
+                return None
+            if from_rack:
+                return self.add_rack(kind, s, back)
+            source = next(i for i, x in enumerate(sets) if len(x.tiles) == 1 and x.tiles[0] is move.tile)
+            if source >= self.max_sets:
+                return None
+            return self.add_board(source, s, back)
+        return None
+
+    def decode(self, game, player, action):
+        # the move for an action number, or None for DONE
+        kind_of = game.codec.kind_of
+        sets = game.board.sets
+        if action == self.PICK:
+            return PickTile(game.pouch)
+        if action == self.DONE:
+            return None
+        if action < self.add_rack_offset:
+            s, pos = divmod(action - self.split_offset, self.max_set_length - 1)
+            return Split(sets[s], pos + 1)
+        if action < self.add_board_offset:
+            rest, back = divmod(action - self.add_rack_offset, 2)
+            kind, s = divmod(rest, self.max_sets)
+            tile = next(tile for tile in player.rack.tiles if kind_of[tile.code] == kind)
+            return Add(tile, sets[s], len(sets[s].tiles) if back else 0)
+        if action < self.new_set_offset:
+            rest, back = divmod(action - self.add_board_offset, 2)
+            source, s = divmod(rest, self.max_sets)
+            return Add(sets[source].tiles[0], sets[s], len(sets[s].tiles) if back else 0)
+        kind = action - self.new_set_offset
+        tile = next(tile for tile in player.rack.tiles if kind_of[tile.code] == kind)
+        return Add(tile, TempSet([]), 0)
+
+
+def allocate(batch_size, num_kinds, action_space=None):
+    # buffers for encode() and action_masks(), allocated once and reused every step
+    buffers = {
+        'rack': np.zeros((batch_size, num_kinds), np.int8),
+        'board': np.zeros((batch_size, MAX_SETS, MAX_SET_LENGTH), np.int8),
+        'set_types': np.zeros((batch_size, MAX_SETS), np.int8),
+        'board_counts': np.zeros((batch_size, num_kinds), np.int8),
+        'pouch_size': np.zeros((batch_size,), np.int16),
+        # the rest are per player, starting with the player to move
+        'rack_sizes': np.zeros((batch_size, MAX_PLAYERS), np.int16),
+        'quarantine': np.zeros((batch_size, MAX_PLAYERS), np.bool_),
+        'first_move': np.zeros((batch_size,), np.bool_),
+    }
+    if action_space is not None:
+        buffers['action_mask'] = np.zeros((batch_size, action_space.size), np.bool_)
+    return buffers
+
+
+def encode(games, players=None, out=None):
+    # encodes each game from the point of view of players[i] (by default the player whose turn it is) and
+    # returns a dict of arrays with one row per game
+    if players is None:
+        players = [game.current for game in games]
+    codec = games[0].codec
+    if out is None:
+        out = allocate(len(games), codec.num_kinds)
+    kind_of = np.asarray(codec.kind_of, np.int64)
+    num_kinds = codec.num_kinds
+    for array in out.values():
+        array[:len(games)] = 0
+
+    for row, (game, current) in enumerate(zip(games, players)):
+        num_players = len(game.players)
+        player = game.players[current]
+        codes = [tile.code for tile in player.rack.tiles]
+        out['rack'][row] = np.bincount(kind_of[codes], minlength=num_kinds)
+        board_codes = []
+        for s, board_set in enumerate(game.board.sets[:MAX_SETS]):
+            set_codes = [tile.code for tile in board_set.tiles[:MAX_SET_LENGTH]]
+            out['board'][row, s, :len(set_codes)] = kind_of[set_codes] + 1
+            out['set_types'][row, s] = SET_TYPE_CODES[type(board_set)]
+            board_codes.extend(tile.code for tile in board_set.tiles)
+        out['board_counts'][row] = np.bincount(kind_of[board_codes], minlength=num_kinds)
+        out['pouch_size'][row] = len(game.pouch)
+        for i in range(num_players):
+            other = game.players[(current + i) % num_players]
+            out['rack_sizes'][row, i] = len(other.rack)
+            out['quarantine'][row, i] = other.in_quarantine
+        out['first_move'][row] = player.first_move
+    return out
+
+
+def action_masks(games, action_space, players=None, out=None):
+    # (games, action_space.size) array, True for every action the move generator allows
+    if players is None:
+        players = [game.current for game in games]
+    if out is None:
+        out = np.zeros((len(games), action_space.size), np.bool_)
+    out[:len(games)] = False
+    for row, (game, current) in enumerate(zip(games, players)):
+        player = game.players[current]
+        out[row, action_space.DONE] = True
+        for move in game.iter_moves(player):
+            action = action_space.encode(game, player, move)
+            if action is not None:
+                out[row, action] = True
+    return out
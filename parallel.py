@@ -0,0 +1,148 @@
+import os
+import pickle
+import random
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from rummikub import Color, Game
+from mcts import MCTSPolicy, position_key
+
+# root parallel monte carlo tree search. every worker process keeps an MCTSPolicy of its own with its own
+# random stream, so each one samples different hidden racks, and searches the same position independently for
+# the same wall-clock budget. the position is written once per turn into a shared memory block the workers
+# read it from, and their statistics for the turn (see MCTSPolicy.turn_stats) are added up before the most
+# visited line is played, like a single search with workers times the simulations would.
+
+# bytes reserved for the shared position at first, grown when a position doesn't fit
+SHARED_SIZE = 1 << 16
+
+# set up once per worker process by _init_worker
+_worker = {}
+
+
+def _init_worker(settings, seed):
+    _worker['settings'] = settings
+    _worker['policy'] = MCTSPolicy(seed=seed * 1000003 + multiprocessing.current_process().pid, **settings)
+    _worker['games'] = {}
+    _worker['shared'] = {}
+
+
+def _attach(name):
+    shared = _worker['shared'].get(name)
+    if shared is None:
+        shared = shared_memory.SharedMemory(name)
+        # the block belongs to the process that made it, which unlinks it. without this the worker's resource
+        # tracker would unlink it too, or complain about a leak when the worker exits
+        resource_tracker.unregister(shared._name, 'shared_memory')
+        _worker['shared'][name] = shared
+    return shared
+
+
+def _position(name):
+    # the game in the shared block, restored into a Game this worker keeps around for that game setup
+    buffer = _attach(name).buf
+    size = int.from_bytes(buffer[:8], 'little')
+    (num_players, num_jokers, colors), state, scalars, player = pickle.loads(buffer[8:8 + size])
+    game = _worker['games'].get((num_players, num_jokers, colors))
+    if game is None:
+        game = Game(num_players=num_players, num_jokers=num_jokers, colors=[Color(c) for c in colors], seed=0)
+        _worker['games'][(num_players, num_jokers, colors)] = game
+    game.journal.clear()
+    game.restore(state)
+    game.current, game.end, game.winner, game.turns_without_play, game.turn_rack_size = scalars
+    return game, game.players[player]
+
+
+def _search(name, time_limit, iterations):
+    game, player = _position(name)
+    policy = _worker['policy']
+    policy.time_limit = time_limit
+    policy.iterations = iterations
+    policy.search(game, player)
+    return policy.turn_stats(game, player)
+
+
+def merge_stats(all_stats):
+    # adds up turn statistics from several searches
+    merged = {}
+    for stats in all_stats:
+        for position, edges in stats.items():
+            into = merged.setdefault(position, {})
+            for key, (visits, total) in edges.items():
+                edge = into.setdefault(key, [0, 0.0])
+                edge[0] += visits
+                edge[1] += total
+    return merged
+
+
+class ParallelMCTSPolicy:
+    # MCTSPolicy spread over workers processes (one per core by default). time_limit is the wall-clock
+    # budget per turn; iterations, if given, is the total number of simulations, split between the workers.
+    # the other settings go to every worker's MCTSPolicy
+    def __init__(self, workers=None, time_limit=1.0, iterations=None, seed=None, **settings):
+        self.workers = workers or os.cpu_count()
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.seed = seed if seed is not None else random.randrange(1 << 31)
+        self.settings = settings
+        # plays the merged line in this process
+        self.local = MCTSPolicy(seed=self.seed, **settings)
+        self._pool = None
+        self._shared = None
+
+    def __str__(self):
+        return f'mcts-{self.workers}'
+
+    def __getstate__(self):
+        # a copy sent to another process starts its own pool there
+        state = dict(self.__dict__)
+        state['_pool'] = None
+        state['_shared'] = None
+        return state
+
+    def _share(self, game, player):
+        colors = []
+        for tile in game.all_tiles:
+            if not tile.is_joker and str(tile.color) not in colors:
+                colors.append(str(tile.color))
+        setup = (len(game.players), game.codec.num_jokers, tuple(colors))
+        scalars = (game.current, game.end, game.winner, game.turns_without_play, game.turn_rack_size)
+        index = next(i for i, p in enumerate(game.players) if p is player)
+        data = pickle.dumps((setup, game.snapshot(), scalars, index), pickle.HIGHEST_PROTOCOL)
+        if self._shared is None or self._shared.size < len(data) + 8:
+            self._release()
+            self._shared = shared_memory.SharedMemory(create=True, size=max(SHARED_SIZE, 2 * (len(data) + 8)))
+        self._shared.buf[:8] = len(data).to_bytes(8, 'little')
+        self._shared.buf[8:8 + len(data)] = data
+        return self._shared.name
+
+    def _release(self):
+        if self._shared is not None:
+            self._shared.close()
+            self._shared.unlink()
+            self._shared = None
+
+    def search(self, game, player):
+        # every worker searches the position, returns the merged statistics
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers, _init_worker, (self.settings, self.seed))
+        name = self._share(game, player)
+        iterations = None if self.iterations is None else -(-self.iterations // self.workers)
+        tasks = [(name, self.time_limit, iterations)] * self.workers
+        return merge_stats(self._pool.starmap(_search, tasks, chunksize=1))
+
+    def play_turn(self, game, player, rng):
+        stats = self.search(game, player)
+        self.local.play_line(game, player, lambda: stats.get(position_key(game, player)))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
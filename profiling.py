@@ -0,0 +1,197 @@
+import os
+import json
+import importlib.util
+import time
+import cProfile
+
+# counters and timers for the engine's hot paths. nothing is measured unless a game is instrumented:
+# instrument() puts timed wrappers over the methods of that one game and its board as instance attributes,
+# so games that aren't instrumented run the plain class methods and pay nothing at all.
+#
+#   stats = instrument(game)
+#   ... play ...
+#   stats.as_dict(), stats.to_json(), stats.prometheus()
+#
+# times are inclusive: check_board_validity and fix_board called from finish_turn count towards both, and
+# 'revert' is the turn rollback (plus any search backing out of a checkpoint).
+
+# the methods instrument() times on the game and on its board
+GAME_PHASES = ['make_move', 'revert', 'undo', 'snapshot', 'restore']
+BOARD_PHASES = ['check_board_validity', 'fix_board']
+
+
+class Stats:
+    def __init__(self):
+        # phase -> number of calls, total seconds
+        self.calls = {}
+        self.seconds = {}
+        # anything else worth counting, like moves generated or turn results
+        self.counters = {}
+
+    def add(self, phase, seconds):
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def timer(self, phase):
+        return _Timer(self, phase)
+
+    def merge(self, other):
+        # adds another Stats, or its as_dict(), into this one, to aggregate over games or worker processes
+        if isinstance(other, Stats):
+            other = other.as_dict()
+        for phase, calls in other['calls'].items():
+            self.calls[phase] = self.calls.get(phase, 0) + calls
+        for phase, seconds in other['seconds'].items():
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        for name, n in other['counters'].items():
+            self.counters[name] = self.counters.get(name, 0) + n
+        return self
+
+    def as_dict(self):
+        return {'calls': dict(self.calls), 'seconds': dict(self.seconds), 'counters': dict(self.counters)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls().merge(data)
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+    def prometheus(self, prefix='rummikub'):
+        # the stats in the Prometheus text exposition format
+        lines = [
+            f'# HELP {prefix}_phase_calls_total Calls to each instrumented phase.',
+            f'# TYPE {prefix}_phase_calls_total counter',
+        ]
+        lines += [f'{prefix}_phase_calls_total{{phase="{phase}"}} {n}' for phase, n in sorted(self.calls.items())]
+        lines += [
+            f'# HELP {prefix}_phase_seconds_total Seconds spent in each instrumented phase.',
+            f'# TYPE {prefix}_phase_seconds_total counter',
+        ]
+        lines += [f'{prefix}_phase_seconds_total{{phase="{phase}"}} {s:.9f}' for phase, s in sorted(self.seconds.items())]
+        lines += [
+            f'# HELP {prefix}_events_total Other counted events.',
+            f'# TYPE {prefix}_events_total counter',
+        ]
+        lines += [f'{prefix}_events_total{{name="{name}"}} {n}' for name, n in sorted(self.counters.items())]
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path):
+        # JSON, or Prometheus text when the file name ends in .prom
+        with open(path, 'w') as f:
+            f.write(self.prometheus() if path.endswith('.prom') else self.to_json())
+
+    def __str__(self):
+        rows = sorted(self.seconds.items(), key=lambda item: -item[1])
+        return '\n'.join(f'{phase:22} {self.calls[phase]:10} calls {seconds:10.3f}s' for phase, seconds in rows)
+
+
+class _Timer:
+    def __init__(self, stats, phase):
+        self.stats = stats
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.stats.add(self.phase, time.perf_counter() - self.start)
+
+
+def _timed(stats, phase, method):
+    perf_counter = time.perf_counter
+
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            stats.add(phase, perf_counter() - start)
+    return timed
+
+
+def _timed_moves(stats, method):
+    # move generation is lazy, so the time is what it takes to produce the moves the caller actually asked for
+    perf_counter = time.perf_counter
+
+    def iter_moves(player):
+        moves = method(player)
+        seconds = 0.0
+        n = 0
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    move = next(moves)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += perf_counter() - start
+                n += 1
+                yield move
+        finally:
+            stats.add('possible_moves', seconds)
+            stats.count('moves_generated', n)
+    return iter_moves
+
+
+def instrument(game, stats=None):
+    # starts timing game's hot paths into stats (a new Stats by default) and returns it
+    if stats is None:
+        stats = Stats()
+    uninstrument(game)
+    # possible_moves goes through iter_moves, so this covers both
+    game.iter_moves = _timed_moves(stats, game.iter_moves)
+    for phase in GAME_PHASES:
+        setattr(game, phase, _timed(stats, phase, getattr(game, phase)))
+    for phase in BOARD_PHASES:
+        setattr(game.board, phase, _timed(stats, phase, getattr(game.board, phase)))
+    game.stats = stats
+    return stats
+
+
+def uninstrument(game):
+    # back to the plain class methods
+    for name in ['iter_moves'] + GAME_PHASES:
+        game.__dict__.pop(name, None)
+    for name in BOARD_PHASES:
+        game.board.__dict__.pop(name, None)
+    game.__dict__.pop('stats', None)
+
+
+class Profiler:
+    # captures a whole game with cProfile, or pyinstrument if asked for and installed, into a file per game
+    def __init__(self, directory, kind='cprofile'):
+        if kind == 'pyinstrument':
+            # optional, only needed for this mode. checked here to fail early when it's missing
+            if importlib.util.find_spec('pyinstrument') is None:
+                raise ImportError('the pyinstrument profiler needs the pyinstrument package')
+        elif kind != 'cprofile':
+            raise ValueError(f'unknown profiler {kind}')
+        self.directory = directory
+        self.kind = kind
+
+    def path(self, name):
+        return os.path.join(self.directory, f'{name}.{"html" if self.kind == "pyinstrument" else "prof"}')
+
+    def run(self, name, function, *args, **kwargs):
+        # calls function and writes its profile to path(name)
+        os.makedirs(self.directory, exist_ok=True)
+        if self.kind == 'pyinstrument':
+            import pyinstrument
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.stop()
+                with open(self.path(name), 'w') as f:
+                    f.write(profiler.output_html())
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            profile.dump_stats(self.path(name))
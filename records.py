@@ -0,0 +1,403 @@
+import os
+import mmap
+import bisect
+from rummikub import Color, Game, Split, Add, PickTile, TempSet, SET_TYPES, SET_CLASSES
+
+# compact binary game records. a file starts with MAGIC and then holds one record per game, each prefixed with
+# its length, so a reader can skip from game to game without decoding anything in between. a record is a
+# sequence of unsigned LEB128 varints:
+#
+#   seed zigzag encoded + 1 (0 when unknown), players, jokers, colors, each color's name as length + utf-8 bytes
+#   each player's starting rack and then the pouch, as a count followed by tile codes in order
+#   events until the end of the record:
+#     END_TURN  drawn tile code + 1 (0 when nothing was drawn)
+#     SPLIT     set index, position
+#     ADD       tile code, target set index + 1 (0 for a new set), 1 to add at the back
+#     PICK      tile code + 1 (0 when the pouch was empty)
+#     PLAY      number of sets, each as type, length, codes, then the number of tiles played and their codes
+#     UNDO      number of moves undone (see Game.undo)
+#     REDO      number of moves made again (see Game.redo)
+#
+# every tile drawn is in the record, so replaying doesn't depend on the random number generator. tile codes
+# are below 128 in a standard game, so most fields take a single byte and a whole game a few hundred.
+
+MAGIC = b'RKGR\x03'
+
+END_TURN = 0
+SPLIT = 1
+ADD = 2
+PICK = 3
+PLAY = 4
+UNDO = 5
+REDO = 6
+
+
+def write_varint(out, n):
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def zigzag(n):
+    # maps 0, -1, 1, -2, ... to 0, 1, 2, 3, ... so negative numbers fit in an unsigned varint
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def unzigzag(n):
+    return n >> 1 if not n & 1 else -(n + 1 >> 1)
+
+
+def read_varint(data, pos):
+    # returns the value and the position after it
+    n = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+class Recorder:
+    # writes down a game as it is played. set as game.recorder, it hears about every move, board replacement,
+    # undo and end of turn. anything done below the turn's own checkpoint (a search trying moves out and
+    # reverting them) isn't part of the game and is left out
+    def __init__(self, game, seed=None):
+        # seed defaults to the one the game was made with
+        if seed is None:
+            seed = game.seed
+        self.data = bytearray()
+        # moves are recorded while the journal is no deeper than the checkpoint start_turn opens
+        self.depth = len(game.journal.marks) + 1
+        colors = []
+        for tile in game.all_tiles:
+            if not tile.is_joker and str(tile.color) not in colors:
+                colors.append(str(tile.color))
+        write_varint(self.data, 0 if seed is None else zigzag(seed) + 1)
+        write_varint(self.data, len(game.players))
+        write_varint(self.data, game.codec.num_jokers)
+        write_varint(self.data, len(colors))
+        for color in colors:
+            name = color.encode()
+            write_varint(self.data, len(name))
+            self.data += name
+        for player in game.players:
+            self._codes(player.rack.tiles)
+        self._codes(game.pouch.tiles)
+        game.recorder = self
+
+    def _codes(self, tiles):
+        write_varint(self.data, len(tiles))
+        for tile in tiles:
+            write_varint(self.data, tile.code)
+
+    def recording(self, game):
+        return len(game.journal.marks) <= self.depth
+
+    def move(self, game, player, move):
+        if not self.recording(game):
+            return
+        data = self.data
+        if isinstance(move, Split):
+            data.append(SPLIT)
+            write_varint(data, game.board.find_set(move.to_split))
+            write_varint(data, move.split_at)
+        elif isinstance(move, Add):
+            data.append(ADD)
+            write_varint(data, move.tile.code)
+            write_varint(data, game.board.find_set(move.set_to_add) + 1 if move.set_to_add.tiles else 0)
+            write_varint(data, int(move.pos_to_add != 0))
+        elif isinstance(move, PickTile):
+            data.append(PICK)
+            write_varint(data, 0 if move.tile is None else move.tile.code + 1)
+
+    def play_sets(self, game, sets, played):
+        if not self.recording(game):
+            return
+        data = self.data
+        data.append(PLAY)
+        write_varint(data, len(sets))
+        for s in sets:
+            write_varint(data, SET_TYPES[type(s)])
+            self._codes(s.tiles)
+        self._codes(played)
+
+    def undo(self, game, n):
+        if not self.recording(game):
+            return
+        self.data.append(UNDO)
+        write_varint(self.data, n)
+
+    def redo(self, game, n):
+        if not self.recording(game):
+            return
+        self.data.append(REDO)
+        write_varint(self.data, n)
+
+    def end_turn(self, game, drawn):
+        # called once the turn's checkpoint is closed, so one level further out than the moves
+        if len(game.journal.marks) >= self.depth:
+            return
+        self.data.append(END_TURN)
+        write_varint(self.data, 0 if drawn is None else drawn.code + 1)
+
+    def detach(self, game):
+        # stops recording and returns the finished record
+        if game.recorder is self:
+            game.recorder = None
+        return bytes(self.data)
+
+
+class GameRecord:
+    # a decoded record: how the game was set up and the list of events, each a tuple starting with its opcode
+    def __init__(self, seed, num_players, num_jokers, colors, racks, pouch, events):
+        self.seed = seed
+        self.num_players = num_players
+        self.num_jokers = num_jokers
+        self.colors = colors
+        self.racks = racks
+        self.pouch = pouch
+        self.events = events
+
+    @classmethod
+    def decode(cls, data):
+        pos = 0
+
+        def varint():
+            nonlocal pos
+            n, pos = read_varint(data, pos)
+            return n
+
+        def codes():
+            return [varint() for _ in range(varint())]
+
+        seed = varint()
+        num_players = varint()
+        num_jokers = varint()
+        colors = []
+        for _ in range(varint()):
+            length = varint()
+            colors.append(bytes(data[pos:pos + length]).decode())
+            pos += length
+        racks = [codes() for _ in range(num_players)]
+        pouch = codes()
+        events = []
+        while pos < len(data):
+            op = data[pos]
+            pos += 1
+            if op == END_TURN or op == PICK:
+                events.append((op, varint() - 1))
+            elif op == SPLIT:
+                events.append((op, varint(), varint()))
+            elif op == ADD:
+                events.append((op, varint(), varint() - 1, varint()))
+            elif op == PLAY:
+                sets = [(varint(), codes()) for _ in range(varint())]
+                events.append((op, sets, codes()))
+            elif op == UNDO or op == REDO:
+                events.append((op, varint()))
+            else:
+                raise ValueError(f'unknown event {op} at byte {pos - 1}')
+        return cls(None if seed == 0 else unzigzag(seed - 1), num_players, num_jokers, colors, racks, pouch, events)
+
+    def new_game(self):
+        # the game as it was dealt. the racks and pouch come from the record rather than from dealing again, so
+        # this holds for records made with any random stream
+        game = Game(num_players=self.num_players, num_jokers=self.num_jokers,
+                    colors=[Color(c) for c in self.colors], seed=self.seed)
+        all_tiles = game.all_tiles
+        for player, rack in zip(game.players, self.racks):
+            player.rack.tiles = [all_tiles[code] for code in rack]
+        game.pouch.tiles = [all_tiles[code] for code in self.pouch]
+        return game
+
+    def apply(self, game, event):
+        # plays one event on a game that has been replayed up to it, starting a turn first if none is open
+        all_tiles = game.all_tiles
+        sets = game.board.sets
+        player = game.players[game.current]
+        if not game.journal.marks:
+            game.start_turn(player)
+        op = event[0]
+        if op == SPLIT:
+            game.make_move(player, Split(sets[event[1]], event[2]))
+        elif op == ADD:
+            _, code, target, back = event
+            to_add = TempSet([]) if target < 0 else sets[target]
+            game.make_move(player, Add(all_tiles[code], to_add, len(to_add.tiles) if back else 0))
+        elif op == PICK:
+            game.make_move(player, _pick(game, event[1]))
+        elif op == PLAY:
+            board = [SET_CLASSES[set_type]([all_tiles[code] for code in codes]) for set_type, codes in event[1]]
+            game.play_sets(player, board, [all_tiles[code] for code in event[2]])
+        elif op == UNDO:
+            game.undo(event[1])
+        elif op == REDO:
+            game.redo(event[1])
+        elif op == END_TURN:
+            game.finish_turn(player, _pick(game, event[1]))
+
+    def replay(self, upto=None):
+        # the game after its first upto events, all of them by default
+        game = self.new_game()
+        for event in self.events[:upto]:
+            self.apply(game, event)
+        return game
+
+    def turns(self):
+        return sum(1 for event in self.events if event[0] == END_TURN)
+
+
+class Replay:
+    # random access to the positions of a recorded game. the game is played through once, keeping a snapshot
+    # at the end of every interval-th turn, and position(k) restores the nearest snapshot at or before event k
+    # and plays forward from there, so no position is more than interval turns of events away
+    def __init__(self, record, interval=8):
+        self.record = record
+        self.game = record.new_game()
+        # event index -> saved position, both in event order
+        self.indices = [0]
+        self.snapshots = [self._save()]
+        turns = 0
+        for i, event in enumerate(record.events):
+            record.apply(self.game, event)
+            if event[0] == END_TURN:
+                turns += 1
+                if turns % interval == 0:
+                    self.indices.append(i + 1)
+                    self.snapshots.append(self._save())
+        self.at = len(record.events)
+
+    def __len__(self):
+        return len(self.record.events)
+
+    def _save(self):
+        # snapshots are only taken between turns, when the journal has nothing open
+        game = self.game
+        return (game.snapshot(), game.current, game.end, game.winner, game.turns_without_play, game.turn_rack_size)
+
+    def _load(self, saved):
+        game = self.game
+        state, game.current, game.end, game.winner, game.turns_without_play, game.turn_rack_size = saved
+        game.journal.clear()
+        game.restore(state)
+
+    def position(self, k):
+        # the game after the first k events. the same game object is reused by every call, so take a snapshot()
+        # of it to keep a position around
+        if not 0 <= k <= len(self):
+            raise IndexError(k)
+        i = bisect.bisect_right(self.indices, k) - 1
+        # playing on from where the game is now beats restoring when there's no snapshot in between
+        if not self.indices[i] <= self.at <= k:
+            self._load(self.snapshots[i])
+            self.at = self.indices[i]
+        for event in self.record.events[self.at:k]:
+            self.record.apply(self.game, event)
+        self.at = k
+        return self.game
+
+    def turn_starts(self):
+        # event index at which each turn starts
+        starts = [0]
+        for i, event in enumerate(self.record.events):
+            if event[0] == END_TURN:
+                starts.append(i + 1)
+        return starts[:-1] if starts[-1] == len(self) else starts
+
+
+def _pick(game, code):
+    # a PickTile that draws the recorded tile rather than a random one
+    move = PickTile(game.pouch)
+    move.tile = None if code < 0 else game.all_tiles[code]
+    return move
+
+
+class GameWriter:
+    # appends length-prefixed records to a file as games finish
+    def __init__(self, path, append=False):
+        exists = append and os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f'{path} is not a game record file of this version')
+        self.file = open(path, 'ab' if exists else 'wb')
+        if not exists:
+            self.file.write(MAGIC)
+        self.games = 0
+
+    def write(self, record):
+        # record is the bytes returned by Recorder.detach
+        prefix = bytearray()
+        write_varint(prefix, len(record))
+        self.file.write(prefix)
+        self.file.write(record)
+        self.games += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameReader:
+    # memory maps a record file and finds where each game starts by hopping over the length prefixes, so
+    # any game can be decoded on its own without reading the rest
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        # mmap can't map an empty file, and an empty file has no MAGIC either
+        if os.fstat(self.file.fileno()).st_size < len(MAGIC):
+            self.file.close()
+            raise ValueError(f'{path} is not a game record file')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not a game record file')
+        self.offsets = []
+        pos = len(MAGIC)
+        size = len(self.data)
+        while pos < size:
+            length, start = read_varint(self.data, pos)
+            if start + length > size:
+                # a record cut short by a writer that didn't finish
+                break
+            self.offsets.append((start, length))
+            pos = start + length
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def raw(self, i):
+        start, length = self.offsets[i]
+        return memoryview(self.data)[start:start + length]
+
+    def __getitem__(self, i):
+        raw = self.raw(i)
+        try:
+            return GameRecord.decode(raw)
+        finally:
+            raw.release()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def replay(self, i, upto=None):
+        return self[i].replay(upto)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,9 +1,12 @@
 import random
 import collections
+from array import array
 from dataclasses import dataclass
-import copy
 import graphics
 from typing import Union
+from compact import TileCodec, CompactState, GROUP, RUN, TEMPSET
+from meldindex import meld_index
+from journal import Journal, REMOVE_SET, APPEND_SET, REPLACE_SET, INSERT_TILE, RACK_REMOVE, RACK_ADD, POUCH_REMOVE, SET_ATTR
 
 @dataclass
 class Color:
@@ -21,11 +24,13 @@ class Color:
 
 @dataclass
 class Tile:
-    def __init__(self, color: Color, number: int, is_joker=False):
+    def __init__(self, color: Color, number: int, is_joker=False, code=None):
         self.color = color
         self.number = number
         self.on_board = False
         self.is_joker = is_joker
+        # small integer id of this exact tile within its game, see compact.py
+        self.code = code
     
     def __eq__(self, other):
         if isinstance(other, Tile):
@@ -66,48 +71,55 @@ class TempSet:
 Set = Group | Run
 # Set = Union[Group, Run]
 
+# mapping between set classes and the set types of the compact board encoding
+SET_TYPES = {Group: GROUP, Run: RUN, TempSet: TEMPSET}
+SET_CLASSES = {GROUP: Group, RUN: Run, TEMPSET: TempSet}
+
 @dataclass
 class Board:
-    def __init__(self):
+    def __init__(self, codec, journal=None):
         self.sets = []
+        # tile codes are turned into kinds to look sets up in the meld index
+        self.codec = codec
+        # changes are recorded here so a turn can be rolled back, see Game.checkpoint
+        self.journal = journal if journal is not None else Journal()
 
     def __str__(self):
         return f'{self.sets}'
 
+    def find_set(self, to_find):
+        # index of a set on the board, preferring the exact object over an equal copy
+        for i, s in enumerate(self.sets):
+            if s is to_find:
+                return i
+        return self.sets.index(to_find)
+
+    def encode(self):
+        return tuple((SET_TYPES[type(s)], tuple(tile.code for tile in s.tiles)) for s in self.sets)
+
+    def decode(self, encoded, all_tiles):
+        self.sets = [SET_CLASSES[set_type]([all_tiles[code] for code in codes]) for set_type, codes in encoded]
+
+    def kinds(self, s):
+        kind_of = self.codec.kind_of
+        return [kind_of[tile.code] for tile in s.tiles]
+
     def check_run_validity(self, run):
-        total = 0
-        for i in range(len(run.tiles)):
-            if run.tiles[i].is_joker:
-                if i==0:
-                    run.tiles[i].number = run.tiles[i + 1].number - 1
-                    run.tiles[i].color = run.tiles[i+1].color
-                else:
-                    run.tiles[i].number = run.tiles[i - 1].number + 1
-                    run.tiles[i].color = run.tiles[i - 1].color
-            total += run.tiles[i].number
-        for j in range(len(run.tiles) - 1):
-            if run.tiles[j].number != run.tiles[j+1].number - 1 or run.tiles[j].color != run.tiles[j+1].color:
-                return False
-        return True, total
+        # jokers are worth the tile they stand in for. tiles are never changed by the check
+        total = meld_index(self.codec.num_colors, self.codec.num_jokers).run_value(self.kinds(run))
+        return total is not None, total
            
     def check_group_validity(self, group):
-        total = 0
-        if len(group.tiles) > 4:
-            return False, None
-        # checks for different colors
-        if len(group.tiles) != len(set(group.tiles)):
+        # at most 4 tiles, all with the same number and no two tiles of the same color
+        total = meld_index(self.codec.num_colors, self.codec.num_jokers).group_value(self.kinds(group))
+        return total is not None, total
+
+    def check_tempset_validity(self, tempset):
+        # a tempset is a set of tile put down by the user. we don't know if it's a group or a run yet
+        meld = meld_index(self.codec.num_colors, self.codec.num_jokers).meld_value(self.kinds(tempset))
+        if meld is None:
             return False, None
-        for i in range(len(group.tiles)):
-            if group.tiles[i].is_joker:
-                if i==0:
-                    group.tiles[i].number = group.tiles[i + 1].number
-                else:
-                    group.tiles[i].number = group.tiles[i - 1].number
-            total += group.tiles[i].number
-        for j in range(len(group.tiles) - 1):
-            if group.tiles[j].number != group.tiles[j+1].number:
-                return False, None
-        return True, total
+        return True, meld[1]
         
     def check_board_validity(self, player):
         total = 0
@@ -117,61 +129,125 @@ class Board:
                 return False
             # for each run, we want to check if all values are consecutive
             if isinstance(s, Run):
-                if not self.check_run_validity(s):
-                    return False
+                valid, x = self.check_run_validity(s)
             # for each group, we want to make sure that we have all tiles with the same number, and no two tiles of the same color
-            if isinstance(s, Group):
-                if not self.check_group_validity(s):
-                    return False
-            # a tempset is a set of tile put down by the user. we don't know if it's a group or a run yet, but our if/else statements check for it
-            if isinstance(s, TempSet):
-                # tempset is potentially a group
-                if s.tiles[0].number == s.tiles[1].number or s.tiles[1].number == s.tiles[2].number or s.tiles[0].number == s.tiles[2].number:
-                    group_val, x = self.check_group_validity(s)
-                    if not group_val:
-                        return False
-                # tempset is potentially a run
-                if s.tiles[0].number == s.tiles[1].number - 1 or s.tiles[1].number == s.tiles[2].number - 1 or s.tiles[0].number == s.tiles[2].number - 2:
-                    run_val, x = self.check_run_validity(s)
-                    if not run_val:
-                        return False
-                if player.in_quarantine:
+            elif isinstance(s, Group):
+                valid, x = self.check_group_validity(s)
+            else:
+                valid, x = self.check_tempset_validity(s)
+                # only the sets put down this turn count towards getting out of quarantine
+                if player.in_quarantine and valid:
                     total += x
+            if not valid:
+                return False
         if player.in_quarantine and total < 30:
             return False
         return True
         
     def fix_board(self):
-        for s in self.sets:
+        journal = self.journal
+        for i, s in enumerate(self.sets):
             for tile in s.tiles:
-                tile.on_board = True
+                if not tile.on_board:
+                    journal.record((SET_ATTR, tile, 'on_board', False))
+                    tile.on_board = True
             if isinstance(s, TempSet):
-                self.sets.remove(s)
-                # group
-                if s.tiles[0].number == s.tiles[1].number:
-                    new_group = Group(s.tiles)
-                    self.sets.append(new_group)
-                # run
-                if s.tiles[0].number == s.tiles[1].number - 1:
-                    new_run = Run(s.tiles)
-                    self.sets.append(new_run)
+                new_set = None
+                meld = meld_index(self.codec.num_colors, self.codec.num_jokers).meld_value(self.kinds(s))
+                if meld is not None:
+                    new_set = Run(s.tiles) if meld[0] else Group(s.tiles)
+                if new_set is not None:
+                    journal.record((REPLACE_SET, i, s))
+                    self.sets[i] = new_set
         
 @dataclass
 class Pouch:
-    def __init__(self, num_jokers: int, colors: list):
+    def __init__(self, num_jokers: int, colors: list, rng=None):
         self.num_jokers = num_jokers
-        self.tiles = []
+        # every random draw in a game goes through this, never through the global random module
+        self.rng = rng if rng is not None else random.Random()
+        self.codec = TileCodec(len(colors), num_jokers)
+        self.color_index = {color: i for i, color in enumerate(colors)}
+        tiles = []
+        # tiles are created in code order, so a tile's code is its position in this list
         for _ in range(2):
             for color in colors:
                 for number in range(1, 14):
-                    t = Tile(color, number)
-                    self.tiles.append(t)
+                    t = Tile(color, number, code=len(tiles))
+                    tiles.append(t)
                 
         for i in range(num_jokers):
-            self.tiles.append(Tile(Color("JOKER"), 30, True))
+            tiles.append(Tile(Color("JOKER"), 30, True, code=len(tiles)))
+        # every tile of the game indexed by code, used to turn compact states back into tile objects
+        self.all_tiles = list(tiles)
+
+        # shuffled once, then used as a stack: dealing and drawing take tiles off the end, which is O(1) and
+        # takes exactly the tile that was drawn, never an equal copy of it
+        self.set_codes(self.rng.sample(range(len(tiles)), len(tiles)))
+
+    def set_codes(self, codes):
+        # the pouch is an array of tile codes, top of the stack last, and a count vector over kinds. replacing
+        # the codes (restoring a position) recounts them
+        self.codes = array('H', codes)
+        kind_of = self.codec.kind_of
+        self.counts = [0] * self.codec.num_kinds
+        for code in self.codes:
+            self.counts[kind_of[code]] += 1
+
+    @property
+    def tiles(self):
+        # the tiles left as objects, top of the stack last. a view built on every call, so loops that only
+        # need codes or the size use codes and len(pouch)
+        all_tiles = self.all_tiles
+        return [all_tiles[code] for code in self.codes]
+
+    @tiles.setter
+    def tiles(self, tiles):
+        # to deal a sampled pouch during a search, or put back the one it replaced
+        self.set_codes(tile.code for tile in tiles)
 
-        # shuffling initial tile order to make sure all players are getting random tiles
-        self.tiles = random.sample(self.tiles, len(self.tiles))
+    def __len__(self):
+        return len(self.codes)
+
+    def count(self, color, number):
+        # how many tiles of this color and number are still in the pouch, in O(1)
+        return self.counts[self.codec.kind(self.color_index[color], number)]
+
+    def count_jokers(self):
+        return self.counts[self.codec.joker_kind]
+
+    def deal(self, n):
+        # the top n tiles, taken off the pouch
+        codes = self.codes
+        dealt = codes[len(codes) - n:]
+        del codes[len(codes) - n:]
+        kind_of = self.codec.kind_of
+        for code in dealt:
+            self.counts[kind_of[code]] -= 1
+        return [self.all_tiles[code] for code in dealt]
+
+    def peek(self):
+        # the tile the next draw takes, or None once the pouch is empty
+        return self.all_tiles[self.codes[-1]] if self.codes else None
+
+    def remove(self, tile):
+        # takes out this tile and returns where it was. the top of the stack is checked first, which is where
+        # draws come from; anything else falls back to searching for its code
+        codes = self.codes
+        index = len(codes) - 1
+        if index < 0 or codes[index] != tile.code:
+            index = codes.index(tile.code)
+        del codes[index]
+        self.counts[self.codec.kind_of[tile.code]] -= 1
+        return index
+
+    def put_back(self, index, tile):
+        # undoes remove
+        self.codes.insert(index, tile.code)
+        self.counts[self.codec.kind_of[tile.code]] += 1
+
+    def bits(self):
+        return self.codec.codes_to_bits(self.codes)
 
     def __str__(self):
         return f'{[str(tile) for tile in self.tiles]}'
@@ -180,12 +256,53 @@ class Pouch:
 class Rack:
     def __init__(self, pouch):
         self.pouch = pouch
+        self.set_bits(0)
         tiles = self.generate_random_rack()
         self.tiles = tiles
         
     def generate_random_rack(self) -> []:
-        rack = random.sample(self.pouch.tiles, 14)
+        # the pouch is already shuffled, so its top 14 tiles are a random rack
+        rack = self.pouch.deal(14)
         return rack
+
+    def set_bits(self, bits):
+        # a rack is a bitset over tile codes. its tiles have no order of their own, so tiles is a view of
+        # them by kind, kept until the rack changes
+        self._bits = bits
+        self._tiles = None
+
+    def bits(self):
+        return self._bits
+
+    @property
+    def tiles(self):
+        if self._tiles is None:
+            codec = self.pouch.codec
+            all_tiles = self.pouch.all_tiles
+            codes = sorted(codec.bits_to_codes(self._bits), key=codec.kind_of.__getitem__)
+            self._tiles = tuple(all_tiles[code] for code in codes)
+        return self._tiles
+
+    @tiles.setter
+    def tiles(self, tiles):
+        self.set_bits(self.pouch.codec.codes_to_bits(tile.code for tile in tiles))
+
+    def __len__(self):
+        return self._bits.bit_count()
+
+    def has(self, tile):
+        return self._bits >> tile.code & 1 == 1
+
+    def add(self, tile):
+        self.set_bits(self._bits | 1 << tile.code)
+
+    def remove(self, tile):
+        if not self.has(tile):
+            raise ValueError(f'{tile} is not on the rack')
+        self.set_bits(self._bits ^ 1 << tile.code)
+
+    def counts(self):
+        return self.pouch.codec.counts(self._bits)
         
     def __str__(self):
         return f'{[str(tile) for tile in self.tiles]}'
@@ -217,6 +334,9 @@ class Split:
         if isinstance(other, Split):
             return self.to_split == other.to_split and self.split_at == other.split_at
         return False
+
+    def __hash__(self):
+        return hash((type(self.to_split), tuple(self.to_split.tiles), self.split_at))
         
 @dataclass
 class Add:
@@ -232,168 +352,268 @@ class Add:
         if isinstance(other, Add):
             return self.tile == other.tile and self.set_to_add == other.set_to_add and self.pos_to_add == other.pos_to_add
         return False
+
+    def __hash__(self):
+        return hash((self.tile, type(self.set_to_add), tuple(self.set_to_add.tiles), self.pos_to_add))
   
 @dataclass
 class PickTile:
     def __init__(self, pouch):
         self.pouch = pouch
-        self.tile = random.choice(pouch.tiles)
+        # the tile that will be drawn, the top of the shuffled pouch, or None once the pouch is empty
+        self.tile = pouch.peek()
+
+    def __str__(self):
+        return 'pick a tile'
     
 @dataclass
 class Game:
     def create_board(self):
         graphics.main(self.players[0].rack.tiles)
         
-    def __init__(self, num_players: int, num_jokers: int, colors: list):
+    def __init__(self, num_players: int, num_jokers: int, colors: list, rng=None, seed=None):
+        # the game's own random stream deals the racks and draws tiles. without an rng one is made from seed,
+        # or from a fresh seed that is kept so the game can be played again
+        if rng is None:
+            if seed is None:
+                seed = random.randrange(1 << 63)
+            rng = random.Random(seed)
+        self.seed = seed
+        self.rng = rng
         # create a beginning board
-        self.board = Board()
-        pouch = Pouch(num_jokers=num_jokers, colors=colors)
+        self.journal = Journal()
+        pouch = Pouch(num_jokers=num_jokers, colors=colors, rng=rng)
+        self.board = Board(pouch.codec, self.journal)
         # print(pouch)
         players = []
         for _ in range(num_players):
             p = Player(in_quarantine=True, pouch=pouch)
-            for tile in p.rack.tiles:
-                pouch.tiles.remove(tile)
             players.append(p)
         self.players = players
         self.pouch = pouch
+        self.codec = pouch.codec
+        self.all_tiles = pouch.all_tiles
+        self.move_generator = None
         self.end = False
+        # index of the player whose turn it is
+        self.current = 0
+        # index of the player who emptied their rack, None while nobody has
+        self.winner = None
+        # turns in a row nobody put a tile down, to end games that can't go anywhere once the pouch is empty
+        self.turns_without_play = 0
+        self.turn_rack_size = 0
+        # writes the game down as it is played, see records.py
+        self.recorder = None
         # self.create_board()
+
+    def snapshot(self):
+        # compact copy of the whole position, cheap to store and hash. racks and the pouch are already compact,
+        # the board and the on_board flags are walked tile by tile, so rolling back moves still goes through the
+        # journal, not through snapshots
+        on_board = 0
+        in_quarantine = 0
+        first_move = 0
+        for tile in self.all_tiles:
+            if tile.on_board:
+                on_board |= 1 << tile.code
+        for i, player in enumerate(self.players):
+            if player.in_quarantine:
+                in_quarantine |= 1 << i
+            if player.first_move:
+                first_move |= 1 << i
+        racks = tuple(player.rack.bits() for player in self.players)
+        pouch = tuple(self.pouch.codes)
+        return CompactState(racks, pouch, self.board.encode(), on_board, in_quarantine, first_move,
+                            self.rng.getstate())
+
+    def restore(self, state):
+        # rebuild the object view from a compact state, reusing this game's tile objects
+        all_tiles = self.all_tiles
+        for i, player in enumerate(self.players):
+            player.rack.set_bits(state.racks[i])
+            player.in_quarantine = bool(state.in_quarantine >> i & 1)
+            player.first_move = bool(state.first_move >> i & 1)
+        self.pouch.set_codes(state.pouch)
+        if state.rng is not None:
+            self.rng.setstate(state.rng)
+        self.board.decode(state.board, all_tiles)
+        for tile in all_tiles:
+            tile.on_board = bool(state.on_board >> tile.code & 1)
     
+    def iter_moves(self, player):
+        # lazy, deduplicated moves that can still lead to a valid board, see movegen.py
+        if self.move_generator is None:
+            # imported here since movegen builds on this module
+            from movegen import MoveGenerator
+            self.move_generator = MoveGenerator(self)
+        return self.move_generator.moves(player)
+
     def possible_moves(self, player):
-        # check any tiles that you can directly add to a group
-        possible_moves = []
-        # single tiles available on the board
-        single_tiles = []
-        # choosing a tile
-        if player.first_move:
-            possible_moves.append(PickTile(self.pouch))
-        for s in self.board.sets:
-            # splitting sets
-            if len(s.tiles) == 1:
-                single_tiles.append(s.tiles[0])
-            for set_tile_pos in range(1, len(s.tiles)):
-                move = Split(s, set_tile_pos)
-                if move not in possible_moves:
-                    possible_moves.append(move)
-        for tile in player.rack.tiles:
-            for s in self.board.sets:
-                possible_moves.append(Add(tile, s, 0))
-                possible_moves.append(Add(tile, s, len(s.tiles)))
-        for tile in single_tiles:
-            for s in self.board.sets:
-                possible_moves.append(Add(tile, s, 0))
-                possible_moves.append(Add(tile, s, len(s.tiles)))
-                """
-                # adding to a group
-                if tile.is_joker:
-                    possible_moves.append(Add(tile, s, 0))
-                    possible_moves.append(Add(tile, s, len(s.tiles)))
-                    continue
-                if isinstance(s, Group) or (isinstance(s, TempSet) and len(s.tiles) == 1):
-                    if s.tiles[0].number == tile.number:
-                        if tile.color not in [set_tile.color for set_tile in s.tiles]:
-                            move = Add(tile, s, 0)
-                            if move not in possible_moves:
-                                possible_moves.append(move)
-                # adding to a run
-                if isinstance(s, Run) or (isinstance(s, TempSet) and len(s.tiles) == 1):
-                    if s.tiles[0].color == tile.color:
-                        if s.tiles[0].number == tile.number + 1:
-                            move = Add(tile, s, 0)
-                            if move not in possible_moves:
-                                possible_moves.append(move)
-                        if s.tiles[-1].number == tile.number - 1:
-                            move = Add(tile, s, len(s.tiles))
-                            if move not in possible_moves:
-                                possible_moves.append(move)
-                # adding to a tempset
-                if isinstance(s, TempSet) and len(s.tiles) > 1:
-                    is_run = False
-                    is_group = False
-                    if s.tiles[0].number == s.tiles[1].number:
-                        is_group = True
-                    if s.tiles[0].number == s.tiles[1].number - 1:
-                        is_run = True
-                    if is_group:
-                        if s.tiles[0].number == tile.number:
-                            if tile.color not in [set_tile.color for set_tile in s.tiles]:
-                                move = Add(tile, s, 0)
-                                if move not in possible_moves:
-                                    possible_moves.append(move)
-                    if is_run:
-                        if s.tiles[0].color == tile.color:
-                            if s.tiles[0].number == tile.number + 1:
-                                move = Add(tile, s, 0)
-                                if move not in possible_moves:
-                                    possible_moves.append(move)
-                            if s.tiles[-1].number == tile.number - 1:
-                                move = Add(tile, s, len(s.tiles))
-                                if move not in possible_moves:
-                                    possible_moves.append(move)
-                """
-                
-        for tile in player.rack.tiles:
-            possible_moves.append(Add(tile, TempSet([]), 0))
-        return possible_moves
+        return list(self.iter_moves(player))
                         
+    def checkpoint(self):
+        # start recording changes so the board and racks can be put back with revert()
+        return self.journal.checkpoint()
+
+    def commit(self):
+        self.journal.commit()
+
+    def revert(self):
+        # undo every move made since the last checkpoint, in O(moves made)
+        self.journal.revert(self.board)
+
+    def undo(self, n=1):
+        # take back the last n moves (make_move or play_sets) made since the last checkpoint, for a player
+        # changing their mind or search code backing out of a branch. raises ValueError if there aren't n
+        self.journal.undo(self.board, n)
+        if n and self.recorder is not None:
+            self.recorder.undo(self, n)
+
+    def redo(self, n=1):
+        # make again the last n moves undone. making any other move forgets the moves that could be redone
+        self.journal.redo(self.board, n)
+        if n and self.recorder is not None:
+            self.recorder.redo(self, n)
+
+    def set_attr(self, obj, name, value):
+        # changes an attribute through the journal, so search code that wraps whole turns in a checkpoint can
+        # undo it
+        self.journal.record((SET_ATTR, obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    def start_turn(self, player):
+        self.set_attr(player, 'first_move', True)
+        self.set_attr(self, 'turn_rack_size', len(player.rack))
+        # everything done this turn goes into the journal, so an invalid turn can be rolled back
+        self.checkpoint()
+
+    def finish_turn(self, player, draw=None):
+        # keeps a valid board, or rolls back an invalid one and adds a tile to the player's rack. returns
+        # 'played', 'picked', 'drew' (hit done without doing anything) or 'invalid'. draw is the PickTile to
+        # use if the player has to draw, a random tile from the pouch by default
+        drawn = None
+        if self.board.check_board_validity(player):
+            played = len(player.rack) < self.turn_rack_size
+            if player.first_move:
+                drawn = self._pick(player, draw if draw is not None else PickTile(self.pouch))
+                result = 'drew'
+            else:
+                self.board.fix_board()
+                result = 'played' if played else 'picked'
+            self.commit()
+            if played and player.in_quarantine:
+                # the first valid meld of 30 points takes a player out of quarantine
+                self.set_attr(player, 'in_quarantine', False)
+        else:
+            self.revert()
+            drawn = self._pick(player, draw if draw is not None else PickTile(self.pouch))
+            result = 'invalid'
+        if self.recorder is not None:
+            self.recorder.end_turn(self, drawn)
+
+        self.set_attr(self, 'turns_without_play', 0 if result == 'played' else self.turns_without_play + 1)
+        index = next(i for i, p in enumerate(self.players) if p is player)
+        self.set_attr(self, 'current', (index + 1) % len(self.players))
+        if len(player.rack) == 0:
+            self.set_attr(self, 'end', True)
+            self.set_attr(self, 'winner', index)
+        elif len(self.pouch) == 0 and self.turns_without_play >= len(self.players):
+            # nobody can draw and nobody is playing, so nothing will change any more
+            self.set_attr(self, 'end', True)
+        return result
+
+    def play_sets(self, player, sets, played):
+        # replace the whole board with sets, taking the played tiles off the player's rack. this is how a
+        # rearrangement found by the solver is put on the board in one go
+        if self.recorder is not None:
+            self.recorder.play_sets(self, sets, played)
+        journal = self.journal
+        journal.begin_move()
+        board_sets = self.board.sets
+        while board_sets:
+            journal.record((REMOVE_SET, len(board_sets) - 1, board_sets.pop()))
+        for s in sets:
+            board_sets.append(s)
+            journal.record((APPEND_SET,))
+        rack = player.rack
+        for tile in played:
+            rack.remove(tile)
+            journal.record((RACK_REMOVE, rack, tile))
+        if played and player.first_move:
+            journal.record((SET_ATTR, player, 'first_move', True))
+            player.first_move = False
+
     def make_move(self, player, move):
+        if self.recorder is not None:
+            self.recorder.move(self, player, move)
+        journal = self.journal
+        journal.begin_move()
+        sets = self.board.sets
         # when a player splits a group or a run
         if isinstance(move, Split):
-            self.board.sets.remove(move.to_split)
-            self.board.sets.append(TempSet(move.to_split.tiles[0:move.split_at]))
-            self.board.sets.append(TempSet(move.to_split.tiles[move.split_at:]))
+            index = self.board.find_set(move.to_split)
+            to_split = sets.pop(index)
+            journal.record((REMOVE_SET, index, to_split))
+            sets.append(TempSet(to_split.tiles[0:move.split_at]))
+            journal.record((APPEND_SET,))
+            sets.append(TempSet(to_split.tiles[move.split_at:]))
+            journal.record((APPEND_SET,))
         # when a player is adding a tile
         if isinstance(move, Add):
             # tile comes from player's rack
-            if move.tile in player.rack.tiles:
-                player.first_move = False
+            if player.rack.has(move.tile):
+                if player.first_move:
+                    journal.record((SET_ATTR, player, 'first_move', True))
+                    player.first_move = False
+                player.rack.remove(move.tile)
+                journal.record((RACK_REMOVE, player.rack, move.tile))
             # tile comes from the board
             else:
-                for s in self.board.sets:
-                    if len(s.tiles) == 1 and s.tiles[0] == move.tile:
-                        self.board.sets.remove(s)
+                for i, s in enumerate(sets):
+                    if len(s.tiles) == 1 and s.tiles[0] is move.tile and s is not move.set_to_add:
+                        sets.pop(i)
+                        journal.record((REMOVE_SET, i, s))
                         break
             # if the tile is not being added to a run/group that already exists
             if move.set_to_add.tiles == []:
-                self.board.sets.append(TempSet([move.tile]))
-            # append tile at the end
-            if move.pos_to_add == len(move.set_to_add.tiles):
-                for s in self.board.sets:
-                    if s == move.set_to_add:
-                        s.tiles.append(move.tile)
-                        
-            # insert tile at the beginning
-            if move.pos_to_add == 0:
-                for s in self.board.sets:
-                    if s == move.set_to_add:
-                        s.tiles.insert(0, move.tile)
-            if move.tile.on_board == False:
-                player.rack.tiles.remove(move.tile)
+                sets.append(TempSet([move.tile]))
+                journal.record((APPEND_SET,))
+            else:
+                to_add = sets[self.board.find_set(move.set_to_add)]
+                # insert tile at the beginning, or append it at the end
+                pos = 0 if move.pos_to_add == 0 else len(to_add.tiles)
+                to_add.tiles.insert(pos, move.tile)
+                journal.record((INSERT_TILE, to_add, pos))
         if isinstance(move, PickTile):
+            self._pick(player, move)
+
+    def _pick(self, player, move):
+        # draws move.tile into the player's rack and returns it, None if the pouch was empty
+        journal = self.journal
+        if player.first_move:
+            journal.record((SET_ATTR, player, 'first_move', True))
             player.first_move = False
-            t = PickTile(self.pouch).tile
-            player.rack.tiles.append(t)
-            self.pouch.tiles.remove(t)
+        t = move.tile
+        if t is not None:
+            pouch_index = self.pouch.remove(t)
+            journal.record((POUCH_REMOVE, self.pouch, pouch_index, t))
+            player.rack.add(t)
+            journal.record((RACK_ADD, player.rack, t))
+        return t
 
-    
-             
     def __str__(self):
         return f'board: {self.board}, players: {[str(player) for player in self.players]}'
         
     
 
-if __name__ == '__main__':
+def main():
     colors = [Color("red"), Color("blue"), Color("orange"), Color("black")]
     num_players = 2
     game = Game(num_players = num_players, num_jokers = 2, colors=colors)
     print(game)
     while not game.end:
         for i, player in enumerate(game.players):
-            player.first_move = True
-            initial_board = copy.deepcopy(game.board)
-            initial_player_tiles = copy.deepcopy(player.rack.tiles)
-            player.rack.tiles = sorted(player.rack.tiles, key=lambda x: (str(x.color), x.number), reverse=False)
+            game.start_turn(player)
             for s in game.board.sets:
                 print(str(s))
             while True:
@@ -413,19 +633,14 @@ if __name__ == '__main__':
                 except ValueError:
                     print("Invalid input. Please enter a valid integer.")
                 
-            if game.board.check_board_validity(player):
-                if player.first_move:
-                    game.make_move(player, PickTile(game.pouch))
-                    print(f"Player {i} hit done without picking a tile or adding to the board. Adding a tile to their rack.")
-                else:
-                    game.board.fix_board()
-                    # print(f"Player {i} made a valid move! Moving onto the next player.")
-            else:
+            result = game.finish_turn(player)
+            if result == 'drew':
+                print(f"Player {i} hit done without picking a tile or adding to the board. Adding a tile to their rack.")
+            elif result == 'invalid':
                 print(f"Player {i} made an invalid move! Resetting the board and adding a tile to their rack.")
-                game.board = initial_board
-                player.rack.tiles = initial_player_tiles
-                game.make_move(player, PickTile(game.pouch))
             print(game.board.sets)
+            if game.end:
+                break
             """
             if user_move == 0:
                 game.make_move(player, possible_moves[user_move])
@@ -456,3 +671,10 @@ if __name__ == '__main__':
                     print(moves)
                     move = input("What moves would you like to make? Type pass if you do not want to make any moves, say pass.")
             """
+
+
+if __name__ == '__main__':
+    # run the game through the importable module, so the classes here are the same ones that movegen and the
+    # other modules import
+    import rummikub
+    rummikub.main()
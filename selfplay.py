@@ -0,0 +1,188 @@
+import sys
+import json
+import time
+import random
+import argparse
+import multiprocessing
+from rummikub import Color, Game, PickTile
+from solver import best_play
+from records import Recorder, GameWriter
+from profiling import Stats, Profiler, instrument
+
+# headless self-play: complete games between policy objects, with no input() and no printing, spread over a
+# process pool. every game gets its own seed derived from the run's seed, so a game can be played again on its
+# own no matter which worker it ran on.
+
+COLORS = ["red", "blue", "orange", "black"]
+
+
+class RandomPolicy:
+    # makes random moves from the move generator and stops at random. most of its turns end up invalid and
+    # get rolled back, which makes it a cheap opponent and a good stress test for the engine
+    def __init__(self, max_moves=8, stop_probability=0.25):
+        self.max_moves = max_moves
+        self.stop_probability = stop_probability
+
+    def play_turn(self, game, player, rng):
+        for _ in range(self.max_moves):
+            if rng.random() < self.stop_probability:
+                break
+            moves = game.possible_moves(player)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            game.make_move(player, move)
+            if isinstance(move, PickTile):
+                break
+
+    def __str__(self):
+        return 'random'
+
+
+class SolverPolicy:
+    # plays the highest value rearrangement the solver can find within deadline seconds
+    def __init__(self, deadline=0.05):
+        self.deadline = deadline
+
+    def play_turn(self, game, player, rng):
+        solution = best_play(game, player, self.deadline)
+        if solution is not None:
+            game.play_sets(player, solution.sets, solution.played)
+
+    def __str__(self):
+        return 'solver'
+
+
+POLICIES = {'random': RandomPolicy, 'solver': SolverPolicy}
+
+
+def play_game(policies, seed, num_jokers=2, colors=COLORS, max_turns=1000, record=False, stats=False,
+              profiler=None):
+    # plays one game, policies[i] playing for player i, and returns a summary of how it went. with record,
+    # the summary also has the game's binary record under 'record', see records.py. with stats, it has the
+    # time spent in each hot path and in the policies under 'stats', see profiling.py. a profiler captures
+    # the whole game into a file of its own
+    if profiler is not None:
+        return profiler.run(f'game-{seed}', play_game, policies, seed, num_jokers, colors, max_turns, record, stats)
+    game = Game(num_players=len(policies), num_jokers=num_jokers, colors=[Color(c) for c in colors], seed=seed)
+    rng = game.rng
+    recorder = Recorder(game) if record else None
+    game_stats = instrument(game) if stats else None
+    results = {'played': 0, 'picked': 0, 'drew': 0, 'invalid': 0}
+    turns = 0
+    while not game.end and turns < max_turns:
+        i = turns % len(game.players)
+        player = game.players[i]
+        game.start_turn(player)
+        if game_stats is None:
+            policies[i].play_turn(game, player, rng)
+        else:
+            with game_stats.timer('policy'):
+                policies[i].play_turn(game, player, rng)
+        results[game.finish_turn(player)] += 1
+        turns += 1
+    summary = {
+        'seed': seed,
+        'policies': [str(policy) for policy in policies],
+        'winner': game.winner,
+        'turns': turns,
+        # what each player has left on their rack, the usual end of game penalty
+        'scores': [sum(tile.number for tile in player.rack.tiles) for player in game.players],
+        'tiles_left': [len(player.rack) for player in game.players],
+        'pouch_left': len(game.pouch),
+        'turn_results': results,
+    }
+    if record:
+        summary['record'] = recorder.detach(game)
+    if stats:
+        game_stats.count('games')
+        game_stats.count('turns', turns)
+        summary['stats'] = game_stats.as_dict()
+    return summary
+
+
+# set up once per worker process by _init_worker
+_worker = {}
+
+
+def _init_worker(settings, seed):
+    _worker.update(settings)
+    # anything still reaching for the global random module gets a stream of its own per worker
+    random.seed(seed * 1000003 + multiprocessing.current_process().pid)
+
+
+def _play(game_seed):
+    return _play_with(_worker, game_seed)
+
+
+def _play_with(settings, game_seed):
+    profiler = settings['profiler'] if game_seed in settings['profiled'] else None
+    return play_game(settings['policies'], game_seed, settings['num_jokers'], settings['colors'],
+                     settings['max_turns'], settings['record'], settings['stats'], profiler)
+
+
+def run_games(policies, num_games, seed=0, workers=None, num_jokers=2, colors=COLORS, max_turns=1000, chunksize=4,
+              record=False, stats=False, profiler=None, profile_games=0):
+    # plays num_games games across a pool of workers, yielding each result as soon as it's done. results come
+    # back in whatever order they finish. with a profiler, profile_games games picked at random are profiled
+    seeds = [seed * 1000003 + i for i in range(num_games)]
+    profiled = set(random.Random(seed).sample(seeds, min(profile_games, num_games))) if profiler else set()
+    settings = dict(policies=policies, num_jokers=num_jokers, colors=colors, max_turns=max_turns, record=record,
+                    stats=stats, profiler=profiler, profiled=profiled)
+    if workers == 1:
+        for game_seed in seeds:
+            yield _play_with(settings, game_seed)
+        return
+    with multiprocessing.Pool(workers, _init_worker, (settings, seed)) as pool:
+        for result in pool.imap_unordered(_play, seeds, chunksize):
+            yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="play rummikub games between policies without a human")
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to one per core")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--policies', nargs='+', default=['random', 'random'], choices=sorted(POLICIES),
+                        help="one policy per player")
+    parser.add_argument('--jokers', type=int, default=2)
+    parser.add_argument('--max-turns', type=int, default=1000)
+    parser.add_argument('--out', default=None, help="write one JSON line per game here instead of stdout")
+    parser.add_argument('--record', default=None, help="also write every game to this binary record file")
+    parser.add_argument('--stats', default=None,
+                        help="time the engine's hot paths and save the totals here, as JSON or Prometheus text (.prom)")
+    parser.add_argument('--profile', type=int, default=0, help="profile this many games picked at random")
+    parser.add_argument('--profiler', default='cprofile', choices=['cprofile', 'pyinstrument'])
+    parser.add_argument('--profile-dir', default='profiles', help="where the profiles of those games go")
+    args = parser.parse_args(argv)
+
+    policies = [POLICIES[name]() for name in args.policies]
+    profiler = Profiler(args.profile_dir, args.profiler) if args.profile else None
+    out = open(args.out, 'w') if args.out else sys.stdout
+    writer = GameWriter(args.record) if args.record else None
+    stats = Stats() if args.stats else None
+    start = time.perf_counter()
+    games = 0
+    try:
+        for result in run_games(policies, args.games, args.seed, args.workers, args.jokers, COLORS, args.max_turns,
+                                record=writer is not None, stats=stats is not None, profiler=profiler,
+                                profile_games=args.profile):
+            if writer is not None:
+                writer.write(result.pop('record'))
+            if stats is not None:
+                stats.merge(result['stats'])
+            out.write(json.dumps(result) + '\n')
+            games += 1
+    finally:
+        if args.out:
+            out.close()
+        if writer is not None:
+            writer.close()
+        if stats is not None:
+            stats.save(args.stats)
+    elapsed = time.perf_counter() - start
+    print(f'{games} games in {elapsed:.1f}s ({games / elapsed * 60:.0f} games/min)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
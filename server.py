@@ -0,0 +1,365 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from rummikub import Color, Game, Split, Add, PickTile, TempSet, Group, Run
+from selfplay import COLORS, POLICIES
+
+# an asyncio server hosting many tables in one process. clients talk newline-delimited JSON over TCP, one
+# object per line. a client joins a table, gets the position whenever it's their turn and answers with actions
+# until they pick a tile or say they're done. actions sent outside the client's turn are answered with an
+# error and dropped. bots are seated in the server itself. at tables with clients a bot's turn runs on a worker
+# thread, so a slow policy doesn't hold up every other connection, one turn at a time since the policies share
+# the solver. tables of bots only, like bot_tables plays, run bot turns between awaits instead, so thousands
+# of them take thousands of coroutines, not threads.
+#
+# client -> server
+#   {"type": "join", "players": 2, "bots": ["solver"]}    sit at a table with these bots, waiting for others
+#                                                          until the rest of the seats are taken
+#   {"type": "split", "set": 0, "at": 2}                  split board set 0 before its tile 2
+#   {"type": "add", "tile": 17, "set": 3, "back": true}   add tile 17 (rack or a lone board tile) to set 3,
+#                                                          "set": null puts it down as a new set
+#   {"type": "pick"}                                      draw a tile instead of playing, ending the turn
+#   {"type": "done"}                                      end the turn
+#   {"type": "moves"}                                     ask for every move the move generator allows
+# server -> client
+#   {"type": "joined", "table": 1, "seat": 0}
+#   {"type": "state", ...}                                your turn, and again after every action
+#   {"type": "moves", "moves": [...]}                     actions in the format above
+#   {"type": "turn", "seat": 0, "result": "played"}       someone's turn is over, see Game.finish_turn
+#   {"type": "timeout"}                                   the turn ran out of time and was ended for you
+#   {"type": "end", "winner": 0, "scores": [...]}
+#   {"type": "error", "message": "..."}
+#
+# tiles are [code, color, number], codes being the ones of compact.py.
+
+SET_NAMES = {Group: 'group', Run: 'run', TempSet: 'temp'}
+
+
+def encode_tile(tile):
+    return [tile.code, str(tile.color), tile.number]
+
+
+def encode_move(game, player, move):
+    # the action for a move from the move generator
+    if isinstance(move, PickTile):
+        return {'type': 'pick'}
+    if isinstance(move, Split):
+        return {'type': 'split', 'set': game.board.find_set(move.to_split), 'at': move.split_at}
+    target = game.board.find_set(move.set_to_add) if move.set_to_add.tiles else None
+    return {'type': 'add', 'tile': move.tile.code, 'set': target, 'back': move.pos_to_add != 0}
+
+
+def _is_index(value):
+    # JSON true and false come out as bools, which python counts as ints
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_action(game, player, action):
+    # the move for an action, raising ValueError for anything that isn't a move the player can make
+    sets = game.board.sets
+    kind = action.get('type')
+    if kind == 'pick':
+        # drawing is instead of playing, like the move generator only offers it before any other move
+        if not player.first_move:
+            raise ValueError('can\'t draw after making a move')
+        return PickTile(game.pouch)
+    if kind == 'split':
+        s, at = action.get('set'), action.get('at')
+        if not _is_index(s) or not 0 <= s < len(sets):
+            raise ValueError(f'no set {s}')
+        if not _is_index(at) or not 0 < at < len(sets[s].tiles):
+            raise ValueError(f'can\'t split set {s} at {at}')
+        return Split(sets[s], at)
+    if kind == 'add':
+        code, s = action.get('tile'), action.get('set')
+        if not _is_index(code) or not 0 <= code < len(game.all_tiles):
+            raise ValueError(f'no tile {code}')
+        tile = game.all_tiles[code]
+        from_rack = player.rack.has(tile)
+        from_board = any(len(x.tiles) == 1 and x.tiles[0] is tile and i != s for i, x in enumerate(sets))
+        if not (from_rack or from_board):
+            raise ValueError(f'tile {code} is neither on the rack nor on its own on the board')
+        if s is None:
+            if not from_rack:
+                raise ValueError('only rack tiles can start a new set')
+            return Add(tile, TempSet([]), 0)
+        if not _is_index(s) or not 0 <= s < len(sets):
+            raise ValueError(f'no set {s}')
+        return Add(tile, sets[s], len(sets[s].tiles) if action.get('back') else 0)
+    raise ValueError(f'unknown action {kind}')
+
+
+class BotSeat:
+    # without an executor the turn is played right on the event loop
+    def __init__(self, policy, executor=None):
+        self.policy = policy
+        self.executor = executor
+
+    async def play_turn(self, table, player):
+        game = table.game
+        if self.executor is None:
+            self.policy.play_turn(game, player, game.rng)
+            return
+        # nothing else touches the table's game while it waits for this turn
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.policy.play_turn, game, player,
+                                                         game.rng)
+
+    async def send(self, message):
+        pass
+
+
+class ClientSeat:
+    # a seat taken by a connected client. actions arrive on a queue fed by the connection while it's the
+    # client's turn
+    def __init__(self, connection):
+        self.connection = connection
+        self.actions = asyncio.Queue()
+        self.playing = False
+
+    async def send(self, message):
+        await self.connection.send(message)
+
+    async def play_turn(self, table, player):
+        if self.connection.closed:
+            return
+        self.playing = True
+        try:
+            await self._play_turn(table, player)
+        finally:
+            self.playing = False
+            # actions that came in after the one ending the turn are not for the next one
+            while not self.actions.empty():
+                if self.actions.get_nowait() is not None:
+                    await self.send({'type': 'error', 'message': 'not your turn'})
+
+    async def _play_turn(self, table, player):
+        game = table.game
+        deadline = time.monotonic() + table.turn_timeout
+        await self.send(table.state(player))
+        while True:
+            try:
+                action = await asyncio.wait_for(self.actions.get(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                await self.send({'type': 'timeout'})
+                return
+            # None means the client went away, ending the turn the way done would
+            if action is None or action.get('type') == 'done':
+                return
+            if action.get('type') == 'moves':
+                moves = [encode_move(game, player, move) for move in game.iter_moves(player)]
+                await self.send({'type': 'moves', 'moves': moves})
+                continue
+            try:
+                move = decode_action(game, player, action)
+            except ValueError as e:
+                await self.send({'type': 'error', 'message': str(e)})
+                continue
+            game.make_move(player, move)
+            if isinstance(move, PickTile):
+                return
+            await self.send(table.state(player))
+
+
+class Table:
+    def __init__(self, table_id, num_players, num_jokers=2, turn_timeout=60.0, max_turns=1000, seed=None):
+        self.id = table_id
+        self.game = Game(num_players=num_players, num_jokers=num_jokers, colors=[Color(c) for c in COLORS],
+                         seed=seed)
+        self.seats = [None] * num_players
+        self.turn_timeout = turn_timeout
+        self.max_turns = max_turns
+        self.turns = 0
+        self.task = None
+
+    @property
+    def full(self):
+        return all(seat is not None for seat in self.seats)
+
+    def sit(self, seat):
+        index = self.seats.index(None)
+        self.seats[index] = seat
+        return index
+
+    def state(self, player):
+        game = self.game
+        return {
+            'type': 'state',
+            'table': self.id,
+            'seat': next(i for i, p in enumerate(game.players) if p is player),
+            'current': game.current,
+            'board': [{'type': SET_NAMES[type(s)], 'tiles': [encode_tile(t) for t in s.tiles]} for s in game.board.sets],
+            'rack': [encode_tile(t) for t in player.rack.tiles],
+            'rack_sizes': [len(p.rack) for p in game.players],
+            'pouch': len(game.pouch),
+            'in_quarantine': player.in_quarantine,
+            'valid': game.board.check_board_validity(player),
+        }
+
+    async def broadcast(self, message):
+        for seat in self.seats:
+            await seat.send(message)
+
+    async def run(self):
+        # plays the game to the end and returns a summary like selfplay.play_game's
+        game = self.game
+        while not game.end and self.turns < self.max_turns:
+            index = game.current
+            player = game.players[index]
+            game.start_turn(player)
+            await self.seats[index].play_turn(self, player)
+            result = game.finish_turn(player)
+            self.turns += 1
+            await self.broadcast({'type': 'turn', 'table': self.id, 'seat': index, 'result': result})
+            # lets every other table have a turn, even when all the seats here are bots
+            await asyncio.sleep(0)
+        scores = [sum(tile.number for tile in p.rack.tiles) for p in game.players]
+        await self.broadcast({'type': 'end', 'table': self.id, 'winner': game.winner, 'scores': scores})
+        return {'table': self.id, 'seed': game.seed, 'winner': game.winner, 'turns': self.turns, 'scores': scores}
+
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+
+    async def send(self, message):
+        if self.closed:
+            return
+        try:
+            self.writer.write(json.dumps(message).encode() + b'\n')
+            await self.writer.drain()
+        except ConnectionError:
+            self.closed = True
+
+
+class GameServer:
+    def __init__(self, num_jokers=2, turn_timeout=60.0, max_turns=1000):
+        self.num_jokers = num_jokers
+        self.turn_timeout = turn_timeout
+        self.max_turns = max_turns
+        self.tables = {}
+        # tables still waiting for clients, by (players, bots)
+        self.waiting = {}
+        # plays the turns of bots at tables with clients, see BotSeat
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.next_id = 0
+        self.results = []
+
+    def new_table(self, num_players, bots=(), seed=None, executor=None):
+        table = Table(self.next_id, num_players, self.num_jokers, self.turn_timeout, self.max_turns, seed)
+        self.next_id += 1
+        self.tables[table.id] = table
+        for name in bots:
+            table.sit(BotSeat(POLICIES[name](), executor))
+        return table
+
+    def start(self, table):
+        table.task = asyncio.ensure_future(self._run(table))
+
+    async def _run(self, table):
+        result = await table.run()
+        self.results.append(result)
+        del self.tables[table.id]
+        return result
+
+    def join(self, seat, num_players, bots):
+        # seats a client at a table waiting for the same setup, or a new one, starting it once it's full
+        key = (num_players, tuple(bots))
+        table = self.waiting.get(key)
+        if table is None:
+            table = self.waiting[key] = self.new_table(num_players, bots, executor=self.executor)
+        index = table.sit(seat)
+        if table.full:
+            del self.waiting[key]
+            self.start(table)
+        return table, index
+
+    async def handle(self, reader, writer):
+        connection = Connection(reader, writer)
+        seat = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError('expected a JSON object')
+                except ValueError as e:
+                    await connection.send({'type': 'error', 'message': str(e)})
+                    continue
+                if message.get('type') == 'join':
+                    if seat is not None:
+                        await connection.send({'type': 'error', 'message': 'already at a table'})
+                        continue
+                    num_players = message.get('players', 2)
+                    bots = message.get('bots', [])
+                    if not _is_index(num_players) or not 2 <= num_players <= 4 \
+                            or not isinstance(bots, list) or len(bots) >= num_players \
+                            or any(not isinstance(name, str) or name not in POLICIES for name in bots):
+                        await connection.send({'type': 'error', 'message': 'bad table setup'})
+                        continue
+                    seat = ClientSeat(connection)
+                    table, index = self.join(seat, num_players, bots)
+                    await connection.send({'type': 'joined', 'table': table.id, 'seat': index})
+                elif seat is None:
+                    await connection.send({'type': 'error', 'message': 'join a table first'})
+                elif not seat.playing:
+                    await connection.send({'type': 'error', 'message': 'not your turn'})
+                else:
+                    seat.actions.put_nowait(message)
+        except ConnectionError:
+            pass
+        finally:
+            connection.closed = True
+            if seat is not None:
+                seat.actions.put_nowait(None)
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def bot_tables(self, num_tables, policies, seed=0):
+        # plays num_tables bot-only games concurrently, policies naming the bot in each seat
+        tables = []
+        for i in range(num_tables):
+            table = self.new_table(len(policies), policies, seed * 1000003 + i)
+            self.start(table)
+            tables.append(table)
+        return await asyncio.gather(*(table.task for table in tables))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="host rummikub tables for clients and bots")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--jokers', type=int, default=2)
+    parser.add_argument('--turn-timeout', type=float, default=60.0, help="seconds a client has for a turn")
+    parser.add_argument('--max-turns', type=int, default=1000)
+    parser.add_argument('--bot-tables', type=int, default=0,
+                        help="instead of serving, play this many bot tables at once and report how they went")
+    parser.add_argument('--policies', nargs='+', default=['random', 'random'], choices=sorted(POLICIES))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    server = GameServer(args.jokers, args.turn_timeout, args.max_turns)
+    if args.bot_tables:
+        start = time.perf_counter()
+        results = asyncio.run(server.bot_tables(args.bot_tables, args.policies, args.seed))
+        elapsed = time.perf_counter() - start
+        wins = [sum(1 for r in results if r['winner'] == i) for i in range(len(args.policies))]
+        print(f'{len(results)} tables in {elapsed:.1f}s, wins per seat {wins}', file=sys.stderr)
+        return
+    print(f'serving on {args.host}:{args.port}', file=sys.stderr)
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
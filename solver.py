@@ -0,0 +1,528 @@
+import time
+import functools
+from dataclasses import dataclass
+from compact import TileCodec, NUMBERS
+from meldindex import meld_index, MIN_SET, MAX_GROUP
+from rummikub import Group, Run, TempSet
+
+# exact "best play" search: given the tiles on the board (which all have to stay on the board) and the tiles
+# on a player's rack (which may be played), find the arrangement of everything into valid runs and groups
+# that gets the most rack value onto the board.
+#
+# the first try is a branch and bound over tile counts by kind: take the lowest kind that still has to be
+# placed and branch over every meld that could contain it. runs longer than 5 never need to be considered,
+# since any run of 6 or more splits into runs of 3 to 5. it settles most early positions within a few
+# milliseconds, but it is exponential and can take seconds once the board is full.
+#
+# so with up to 2 jokers, when it hasn't finished after HEAD_START seconds, a dynamic program over the numbers
+# 1..13 takes over, in the spirit of van rijn, takes and vis, "the complexity of rummikub problems". going up
+# one number at a time, the state is how long each run in progress is in every color (two at most per color,
+# lengths 0, 1, 2 or 3+), how many jokers are used and, in quarantine, the meld points so far (capped at 30).
+# at each number every color decides which runs its tiles and jokers extend, start or end, and whatever is
+# left of the number goes into at most two groups or stays on the rack. with 2 jokers or fewer every run and
+# group of 3 or more has a real tile in it, which the state doesn't have to keep track of. the program's work
+# grows with the number of states, not with the number of ways the tiles combine. on positions from solver
+# self-play (boards of up to about 60 tiles, racks of up to 25), a solve to optimality took about 40 ms at
+# the median, 140 ms at the 90th percentile and 0.8 s at worst, so a short deadline still cuts some solves
+# short and Solution.optimal says so.
+#
+MAX_RUN = 5
+QUARANTINE_POINTS = 30
+# the dynamic program's limit, see above
+DP_MAX_JOKERS = 2
+# seconds the branch and bound gets before the dynamic program takes over
+HEAD_START = 0.01
+
+
+@dataclass
+class Meld:
+    def __init__(self, kinds, value, is_run):
+        # kinds in board order, jokers included
+        self.kinds = kinds
+        # points the meld is worth with jokers standing in for the tiles they replace
+        self.value = value
+        self.is_run = is_run
+        counts = {}
+        for kind in kinds:
+            counts[kind] = counts.get(kind, 0) + 1
+        self.counts = tuple(counts.items())
+
+    def __str__(self):
+        return f'{"run" if self.is_run else "group"} {self.kinds} ({self.value} points)'
+
+
+def candidate_melds(codec, max_run=MAX_RUN):
+    # every run and group from the meld index that the search needs, one per multiset of kinds
+    index = meld_index(codec.num_colors, codec.num_jokers)
+    melds = []
+    for options in index.by_signature.values():
+        options = [option for option in options if not option[0] or len(option[2]) <= max_run]
+        if options:
+            is_run, value, kinds = max(options, key=lambda option: option[1])
+            melds.append(Meld(kinds, value, is_run))
+    return melds
+
+
+class _Timeout(Exception):
+    pass
+
+
+@dataclass
+class Solution:
+    def __init__(self, sets, played, value, meld_value, optimal):
+        # the whole board after the play
+        self.sets = sets
+        # rack tiles that end up on the board
+        self.played = played
+        # sum of the played tiles' numbers, i.e. how much the player's score goes down
+        self.value = value
+        # points of the newly made melds, what the quarantine threshold is checked against
+        self.meld_value = meld_value
+        # False when the deadline cut the search short and this is only the best play found so far
+        self.optimal = optimal
+
+    def __str__(self):
+        return f'(value: {self.value}, optimal: {self.optimal}, sets: {[str(s) for s in self.sets]})'
+
+
+class MeldSolver:
+    def __init__(self, codec: TileCodec):
+        self.codec = codec
+        self.melds = candidate_melds(codec)
+        self.melds_by_kind = [[] for _ in range(codec.num_kinds)]
+        for meld in self.melds:
+            for kind, _ in meld.counts:
+                self.melds_by_kind[kind].append(meld)
+        self.tile_values = [codec.kind_number(kind) for kind in range(codec.num_kinds)]
+        self.index = meld_index(codec.num_colors, codec.num_jokers)
+
+    def solve(self, rack_tiles, board_tiles, in_quarantine=False, deadline=None):
+        # deadline is the number of seconds the search may take. in quarantine the board can't be touched and
+        # the new melds have to be worth at least 30 points, so only the rack is searched. the dynamic program
+        # always finishes and is exact, so the deadline only cuts the branch and bound short
+        codec = self.codec
+        self._stop_at = None if deadline is None else time.perf_counter() + deadline
+        self._nodes = 0
+        self._in_quarantine = in_quarantine
+        self._seen = {}
+        self._best_value = -1
+        self._best_chosen = None
+        board = [0] * codec.num_kinds
+        rack = [0] * codec.num_kinds
+        if not in_quarantine:
+            for tile in board_tiles:
+                board[codec.kind_of[tile.code]] += 1
+        for tile in rack_tiles:
+            rack[codec.kind_of[tile.code]] += 1
+        remaining = sum(self.tile_values[kind] * count for kind, count in enumerate(rack))
+        use_program = codec.num_jokers <= DP_MAX_JOKERS
+        stop_at = self._stop_at
+        if use_program:
+            # the branch and bound gets a head start: it proves most positions optimal in a few milliseconds,
+            # and when it doesn't, the best play it found tells the program which plays it can skip
+            head_start = time.perf_counter() + HEAD_START
+            self._stop_at = head_start if stop_at is None else min(stop_at, head_start)
+        optimal = True
+        try:
+            # on copies, since a timeout leaves the counts wherever the search was
+            self._search(list(board), list(rack), remaining, 0, 0, [])
+        except _Timeout:
+            optimal = False
+        # when the deadline itself stopped the branch and bound there's no time left for the program
+        if not optimal and use_program and (stop_at is None or time.perf_counter() < stop_at):
+            self._stop_at = stop_at
+            try:
+                self._improve(board, rack, in_quarantine)
+                optimal = True
+            except _Timeout:
+                pass
+        if self._best_chosen is None:
+            return None
+        return self._build(self._best_chosen, rack_tiles, board_tiles, optimal)
+
+    def _improve(self, board, rack, in_quarantine):
+        # runs the program until the best play is sure to have been found, keeping it the way _search does.
+        # most of the time the best play puts down nearly the whole rack, so the program first only looks at
+        # plays leaving little on the rack, and widens that until the best play is sure to be among them:
+        # anything it skipped is worth less than whole - slack
+        joker_kind = self.codec.joker_kind
+        tile_values = self.tile_values
+        # rack tiles that no meld can take, even with every other tile there is, are never played, so they
+        # don't count towards what a play leaves on the rack
+        total = [b + r for b, r in zip(board, rack)]
+        wanted = [count if kind == joker_kind or any(all(total[k] >= c for k, c in meld.counts)
+                                                    for meld in self.melds_by_kind[kind]) else 0
+                  for kind, count in enumerate(rack)]
+        whole = sum(tile_values[kind] * count for kind, count in enumerate(wanted))
+        real = whole - tile_values[joker_kind] * rack[joker_kind]
+        slack = 0
+        while True:
+            found = self._program(board, rack, wanted, in_quarantine, slack)
+            if found is not None and found[0] > self._best_value:
+                self._best_value, self._best_chosen = found
+            # nothing worth more than the best play so far was skipped either
+            widest = real if self._best_value < 0 else min(real, whole - self._best_value)
+            if slack >= widest:
+                return
+            slack = min(4 * slack + 16, widest)
+
+    def _search(self, board, rack, remaining, value, meld_value, chosen):
+        self._nodes += 1
+        # a node can take a tenth of a millisecond on a full board, so the clock is read every 16 of them
+        if self._stop_at is not None and self._nodes & 15 == 0 and time.perf_counter() > self._stop_at:
+            raise _Timeout()
+        # bound: even playing every tile left on the rack can't beat the best play found
+        if value + remaining <= self._best_value:
+            return
+        key = (tuple(board), tuple(rack), min(meld_value, QUARANTINE_POINTS) if self._in_quarantine else 0)
+        if self._seen.get(key, -1) >= value:
+            return
+        self._seen[key] = value
+
+        kind = next((k for k, count in enumerate(board) if count), None)
+        if kind is None:
+            # everything that has to be on the board is in a meld, so this is a legal play
+            if (not self._in_quarantine or meld_value >= QUARANTINE_POINTS or value == 0) and value > self._best_value:
+                self._best_value = value
+                self._best_chosen = list(chosen)
+            kind = next((k for k, count in enumerate(rack) if count), None)
+            if kind is None:
+                return
+            must_place = False
+        else:
+            must_place = True
+
+        tile_values = self.tile_values
+        for meld in self.melds_by_kind[kind]:
+            if any(board[k] + rack[k] < count for k, count in meld.counts):
+                continue
+            taken = []
+            gained = 0
+            for k, count in meld.counts:
+                from_board = min(board[k], count)
+                board[k] -= from_board
+                rack[k] -= count - from_board
+                gained += tile_values[k] * (count - from_board)
+                taken.append((k, from_board, count - from_board))
+            chosen.append(meld)
+            self._search(board, rack, remaining - gained, value + gained, meld_value + meld.value, chosen)
+            chosen.pop()
+            for k, from_board, from_rack in taken:
+                board[k] += from_board
+                rack[k] += from_rack
+
+        if not must_place:
+            # keep one tile of this kind on the rack
+            rack[kind] -= 1
+            self._search(board, rack, remaining - tile_values[kind], value, meld_value, chosen)
+            rack[kind] += 1
+
+    def _program(self, board, rack, wanted, in_quarantine, slack):
+        # (value, melds) of the best play by the dynamic program described at the top, None if the board
+        # tiles can't all be placed. states that have left more than slack points of the real tiles in wanted
+        # on the rack are dropped, so the play found is only sure to be the best one if it's worth at least
+        # all of wanted less slack
+        codec = self.codec
+        num_colors = codec.num_colors
+        joker_kind = codec.joker_kind
+        board_jokers = board[joker_kind]
+        jokers = board_jokers + rack[joker_kind]
+        group_size = min(MAX_GROUP, num_colors)
+        cap = QUARANTINE_POINTS if in_quarantine else 0
+        # a state is packed into an int: 4 bits per color for the index of its pair of run lengths in PAIRS,
+        # then the jokers used, the meld points and the colors putting two (doubles) or one (singles) tiles
+        # of the current number into groups. values are (rack value placed, previous state, choice), the
+        # choices read back by _melds
+        used_at = 4 * num_colors
+        points_at = used_at + 2
+        doubles_at = points_at + 6
+        singles_at = doubles_at + 3
+        layer = {0: (0, None, None)}
+        layers = []
+        # points of the real rack tiles up to the current one
+        offered = 0
+        for number in range(1, NUMBERS + 1):
+            for color in range(num_colors):
+                if self._stop_at is not None and time.perf_counter() > self._stop_at:
+                    raise _Timeout()
+                kind = color * NUMBERS + number - 1
+                on_board = board[kind]
+                available = on_board + rack[kind]
+                offered += number * wanted[kind]
+                lowest = offered - slack
+                at = 4 * color
+                # what the color can do from each pair of run lengths, as a change to the packed state
+                options = []
+                for index, pair in enumerate(PAIRS):
+                    options.append(tuple((((PAIR_INDEX[new_pair] - index) << at) + (run_jokers << used_at)
+                                          + (doubles << doubles_at) + (singles << singles_at),
+                                          run_jokers, gained, points, choice)
+                                         for new_pair, run_jokers, gained, points, doubles, singles, choice
+                                         in _color_options(pair, on_board, available, number)))
+                following = {}
+                for state, (value, _, _) in layer.items():
+                    used = state >> used_at & 3
+                    for change, run_jokers, gained, points, choice in options[state >> at & 15]:
+                        gained += value
+                        if used + run_jokers > jokers or gained < lowest:
+                            continue
+                        key = state + change
+                        if cap:
+                            before = state >> points_at & 63
+                            key += (min(before + points, cap) - before) << points_at
+                        best = following.get(key)
+                        if best is None or gained > best[0]:
+                            following[key] = (gained, state, choice)
+                layers.append(following)
+                layer = following
+            # the groups of this number, with however many jokers they can take
+            following = {}
+            for state, (value, _, _) in layer.items():
+                used = state >> used_at & 3
+                points = state >> points_at & 63
+                base = state & ((1 << doubles_at) - 1)
+                for group_jokers in range(jokers - used + 1):
+                    if _groups(state >> doubles_at & 7, state >> singles_at & 7, group_jokers, group_size) is None:
+                        continue
+                    grown = min(points + number * group_jokers, cap) - points
+                    key = base + (group_jokers << used_at) + (grown << points_at)
+                    best = following.get(key)
+                    if best is None or value > best[0]:
+                        following[key] = (value, state, group_jokers)
+            following = _dominated(following, num_colors)
+            layers.append(following)
+            layer = following
+
+        joker_value = self.tile_values[joker_kind]
+        best_value = -1
+        best_state = None
+        for state, (value, _, _) in layer.items():
+            used = state >> used_at & 3
+            if used < board_jokers or any(PAIRS[state >> 4 * color & 15] not in ENDED for color in range(num_colors)):
+                continue
+            value += joker_value * (used - board_jokers)
+            if in_quarantine and (state >> points_at & 63) < cap and value:
+                continue
+            if value > best_value:
+                best_value = value
+                best_state = state
+        if best_state is None:
+            return None
+        choices = []
+        state = best_state
+        for following in reversed(layers):
+            _, state, choice = following[state]
+            choices.append(choice)
+        choices.reverse()
+        return best_value, self._melds(choices)
+
+    def _melds(self, choices):
+        # turns the choices along the best path of the dynamic program into melds
+        codec = self.codec
+        num_colors = codec.num_colors
+        joker_kind = codec.joker_kind
+        group_size = min(MAX_GROUP, num_colors)
+        runs = [[[], []] for _ in range(num_colors)]
+        melds = []
+        choices = iter(choices)
+        for number in range(1, NUMBERS + 1):
+            grouped = []
+            for color in range(num_colors):
+                kind = color * NUMBERS + number - 1
+                actions, count = next(choices)
+                grouped.append(count)
+                slots = runs[color]
+                free = [0, 1]
+                for length, action in actions:
+                    slot = next(i for i in free if min(len(slots[i]), 3) == length)
+                    free.remove(slot)
+                    if action == END:
+                        melds.append(self._meld(slots[slot], True))
+                        slots[slot] = []
+                    elif action == REAL:
+                        slots[slot].append(kind)
+                    elif action == JOKER:
+                        slots[slot].append(joker_kind)
+            group_jokers = next(choices)
+            doubles = [number - 1 + color * NUMBERS for color, count in enumerate(grouped) if count == 2]
+            singles = [number - 1 + color * NUMBERS for color, count in enumerate(grouped) if count == 1]
+            rest = singles + [joker_kind] * group_jokers
+            if doubles or rest:
+                first = _groups(len(doubles), len(singles), group_jokers, group_size)
+                melds.append(self._meld(doubles + rest[:first], False))
+                if doubles or first < len(rest):
+                    melds.append(self._meld(doubles + rest[first:], False))
+        for slots in runs:
+            for slot in slots:
+                if slot:
+                    melds.append(self._meld(slot, True))
+        return melds
+
+    def _meld(self, kinds, is_run):
+        value = self.index.run_value(kinds) if is_run else self.index.group_value(kinds)
+        return Meld(kinds, value, is_run)
+
+    def _build(self, chosen, rack_tiles, board_tiles, optimal):
+        kind_of = self.codec.kind_of
+        board_pool = {}
+        rack_pool = {}
+        for tile in board_tiles:
+            board_pool.setdefault(kind_of[tile.code], []).append(tile)
+        for tile in rack_tiles:
+            rack_pool.setdefault(kind_of[tile.code], []).append(tile)
+        sets = []
+        played = []
+        meld_value = 0
+        for meld in chosen:
+            tiles = []
+            from_rack = False
+            for kind in meld.kinds:
+                # board tiles are used up first, the same way the search counted them
+                if not self._in_quarantine and board_pool.get(kind):
+                    tiles.append(board_pool[kind].pop())
+                else:
+                    tile = rack_pool[kind].pop()
+                    tiles.append(tile)
+                    played.append(tile)
+                    from_rack = True
+            # sets holding tiles from the rack are put down this turn, just like the ones a player builds by hand
+            if from_rack:
+                sets.append(TempSet(tiles))
+                meld_value += meld.value
+            else:
+                sets.append(Run(tiles) if meld.is_run else Group(tiles))
+        value = sum(self.codec.number_of[tile.code] for tile in played)
+        return Solution(sets, played, value, meld_value, optimal)
+
+
+# what a run does at a number in the dynamic program
+NONE = 0    # no run in this slot, and none starts
+REAL = 1    # starts or goes on with a real tile
+JOKER = 2   # starts or goes on with a joker
+END = 3     # a run of 3 or more ended at the number before
+
+
+@functools.lru_cache(maxsize=None)
+def _slot_options(length, number):
+    # (new length, real tiles, jokers, action) for one run slot of a color at a number
+    if length == 0:
+        options = [(0, 0, 0, NONE)]
+        # a run has to be able to reach 3 tiles by 13
+        if number <= NUMBERS - 2:
+            options += [(1, 1, 0, REAL), (1, 0, 1, JOKER)]
+        return options
+    grown = min(length + 1, 3)
+    options = [] if grown + NUMBERS - number < 3 else [(grown, 1, 0, REAL), (grown, 0, 1, JOKER)]
+    if length == 3:
+        options.append((0, 0, 0, END))
+    return options
+
+
+@functools.lru_cache(maxsize=None)
+def _run_options(pair, available, number):
+    # (new pair, real tiles, jokers, actions) for both run slots of a color at a number, using at most
+    # available real tiles. actions are (old length, action) per slot, for _melds to tell the slots apart
+    options = {}
+    for first in _slot_options(pair[0], number):
+        for second in _slot_options(pair[1], number):
+            real = first[1] + second[1]
+            if real > available:
+                continue
+            new_pair = tuple(sorted((first[0], second[0])))
+            key = (new_pair, real, first[2] + second[2])
+            if key not in options:
+                options[key] = ((pair[0], first[3]), (pair[1], second[3]))
+    return tuple((new_pair, real, jokers, actions) for (new_pair, real, jokers), actions in options.items())
+
+
+def _covers(high, low):
+    # whether a run slot of length high can do whatever one of length low can: 3 or more can go on or end
+    # like any shorter run, or start over like an empty slot, and 2 needs one tile less than 1
+    return high == low or high == 3 or (high == 2 and low == 1)
+
+
+def _dominating(pair):
+    # the pairs of run slots that can do whatever pair can, pair itself left out
+    pairs = [(a, b) for a in range(4) for b in range(a, 4) if (a, b) != pair]
+    return tuple(p for p in pairs if (_covers(p[0], pair[0]) and _covers(p[1], pair[1]))
+                 or (_covers(p[1], pair[0]) and _covers(p[0], pair[1])))
+
+
+# the pairs of run lengths of a color, shortest first, and their indexes in the program's packed states
+PAIRS = tuple((a, b) for a in range(4) for b in range(a, 4))
+PAIR_INDEX = {pair: index for index, pair in enumerate(PAIRS)}
+# pairs without a run that is still too short, which the last number may leave
+ENDED = {pair for pair in PAIRS if 1 not in pair and 2 not in pair}
+# for every pair index, how to change it into each pair that dominates it
+DOMINATING = tuple(tuple(PAIR_INDEX[other] - index for other in _dominating(pair)) for index, pair in enumerate(PAIRS))
+
+
+def _dominated(layer, num_colors):
+    # layer without the states some other state with a value at least as high dominates, being the same
+    # but for the run lengths of one color, which can do whatever these can
+    kept = {}
+    for state, entry in layer.items():
+        value = entry[0]
+        dominated = False
+        for at in range(0, 4 * num_colors, 4):
+            for change in DOMINATING[state >> at & 15]:
+                other = layer.get(state + (change << at))
+                if other is not None and other[0] >= value:
+                    dominated = True
+                    break
+            if dominated:
+                break
+        if not dominated:
+            kept[state] = entry
+    return kept
+
+
+@functools.lru_cache(maxsize=None)
+def _color_options(pair, on_board, available, number):
+    # everything a color can do at a number: (new pair, jokers, rack value placed, meld points, new doubles,
+    # new singles, choice), choice being what _melds reads back. every board tile has to be placed
+    options = []
+    for new_pair, run_tiles, run_jokers, actions in _run_options(pair, available, number):
+        for grouped in range(min(available - run_tiles, 2) + 1):
+            placed = run_tiles + grouped
+            if placed < on_board:
+                continue
+            options.append((new_pair, run_jokers, number * (placed - on_board), number * (placed + run_jokers),
+                            int(grouped == 2), int(grouped == 1), (actions, grouped)))
+    return tuple(options)
+
+
+@functools.lru_cache(maxsize=None)
+def _groups(doubles, singles, jokers, group_size):
+    # how many of the singles and jokers go into the first group when the colors with two tiles of a number
+    # (one in each group), the colors with one and the jokers make up to two valid groups. 0 when there is
+    # nothing to group, None when they can't be grouped
+    total = 2 * doubles + singles + jokers
+    if total == 0:
+        return 0
+    rest = singles + jokers
+    if doubles == 0 and MIN_SET <= rest <= group_size:
+        return rest
+    for first in range(max(0, MIN_SET - doubles), group_size - doubles + 1):
+        if MIN_SET <= doubles + rest - first <= group_size and first <= rest:
+            return first
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def solver_for(num_colors, num_jokers):
+    return MeldSolver(TileCodec(num_colors, num_jokers))
+
+
+def best_play(game, player, deadline=None):
+    # the highest value play for player from the current position, or None if nothing can be played
+    codec = game.codec
+    solver = solver_for(codec.num_colors, codec.num_jokers)
+    board_tiles = [tile for s in game.board.sets for tile in s.tiles]
+    solution = solver.solve(player.rack.tiles, board_tiles, player.in_quarantine, deadline)
+    if solution is None or not solution.played:
+        return None
+    if player.in_quarantine:
+        # the existing board stays exactly as it is
+        solution.sets = list(game.board.sets) + solution.sets
+    return solution
@@ -0,0 +1,41 @@
+import random
+import pytest
+from compact import TileCodec, COPIES
+from evaluation import Evaluator
+
+# incremental rack evaluation against evaluating the whole count vector
+
+
+@pytest.mark.parametrize('num_colors, num_jokers', [(4, 2), (3, 1), (5, 2)])
+def test_incremental_matches_full(num_colors, num_jokers):
+    codec = TileCodec(num_colors, num_jokers)
+    evaluator = Evaluator(codec)
+    rng = random.Random(num_colors)
+    limit = [COPIES] * codec.num_real_kinds + [num_jokers]
+    rack = evaluator.rack()
+    for _ in range(20000):
+        counts = rack.counts
+        held = [kind for kind, count in enumerate(counts) if count]
+        # mostly adding until the rack has 20 tiles, then going back and forth around that
+        if held and (sum(counts) > 20 or rng.random() < 0.4):
+            rack.remove(rng.choice(held))
+        else:
+            free = [kind for kind, count in enumerate(counts) if count < limit[kind]]
+            rack.add(rng.choice(free))
+        signature = rack.signature()
+        assert rack.features() == evaluator.features(signature)
+        assert rack.value() == pytest.approx(evaluator.value(signature))
+
+
+def test_starting_counts_and_removing_missing_tile():
+    codec = TileCodec(4, 2)
+    evaluator = Evaluator(codec)
+    counts = [0] * codec.num_kinds
+    for kind in (0, 1, 2, 13, 26, 39, codec.joker_kind):
+        counts[kind] += 1
+    rack = evaluator.rack(counts)
+    assert rack.features() == evaluator.features(tuple(counts))
+    features = rack.features()
+    assert (features.run_tiles, features.group_tiles, features.jokers) == (3, 4, 1)
+    with pytest.raises(ValueError):
+        rack.remove(5)
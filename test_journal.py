@@ -0,0 +1,71 @@
+import random
+import pytest
+from rummikub import Color, Game, PickTile
+from selfplay import COLORS, RandomPolicy
+
+# undo and redo by move against the positions the game went through
+
+
+def position(game, player):
+    # the sets by identity as well as by tiles, since redo has to put back the very same objects. the pouch's
+    # counts have to follow its codes
+    assert game.pouch.counts == game.codec.counts(game.pouch.bits())
+    return ([(s, tuple(tile.code for tile in s.tiles)) for s in game.board.sets],
+            player.rack.bits(), player.rack.tiles, player.first_move, tuple(game.pouch.codes))
+
+
+def test_undo_and_redo_go_back_and_forth():
+    rng = random.Random(2)
+    for seed in range(20):
+        game = Game(num_players=2, num_jokers=2, colors=[Color(c) for c in COLORS], seed=seed)
+        policy = RandomPolicy()
+        # a few turns in, so there is a board to rearrange
+        for _ in range(10):
+            player = game.players[game.current]
+            game.start_turn(player)
+            policy.play_turn(game, player, rng)
+            game.finish_turn(player)
+        player = game.players[game.current]
+        game.start_turn(player)
+        positions = [position(game, player)]
+        for _ in range(12):
+            moves = [move for move in game.possible_moves(player) if not isinstance(move, PickTile)]
+            if not moves:
+                break
+            game.make_move(player, rng.choice(moves))
+            positions.append(position(game, player))
+        at = len(positions) - 1
+        assert game.journal.undoable() == at
+        for _ in range(30):
+            if rng.random() < 0.5 and at:
+                n = rng.randint(1, at)
+                game.undo(n)
+                at -= n
+            elif game.journal.undone:
+                n = rng.randint(1, len(game.journal.undone))
+                game.redo(n)
+                at += n
+            assert position(game, player) == positions[at]
+            assert game.journal.undoable() == at
+        game.revert()
+        assert position(game, player) == positions[0]
+
+
+def test_new_move_forgets_redo():
+    rng = random.Random(4)
+    game = Game(num_players=2, num_jokers=2, colors=[Color(c) for c in COLORS], seed=4)
+    player = game.players[0]
+    game.start_turn(player)
+
+    def random_move():
+        moves = [move for move in game.possible_moves(player) if not isinstance(move, PickTile)]
+        game.make_move(player, rng.choice(moves))
+
+    for _ in range(3):
+        random_move()
+    game.undo(2)
+    random_move()
+    with pytest.raises(ValueError):
+        game.redo()
+    with pytest.raises(ValueError):
+        game.undo(3)
@@ -0,0 +1,43 @@
+from rummikub import Color, Game
+from selfplay import COLORS
+from mcts import MCTSPolicy
+
+# the search leaves the game as it found it, and plays an opening meld the solver sees
+
+
+def opening_position(seed=3):
+    # player 0 holds red 10, 11 and 12, a run worth 33 points, enough to come out of quarantine. the tiles are
+    # swapped in for rack tiles of their own, from wherever they were dealt
+    game = Game(num_players=2, num_jokers=2, colors=[Color(c) for c in COLORS], seed=seed)
+    player = game.players[0]
+    wanted = [next(t for t in game.all_tiles if str(t.color) == COLORS[0] and t.number == n) for n in (10, 11, 12)]
+    spare = [t for t in player.rack.tiles if all(t is not w for w in wanted)]
+    for tile in wanted:
+        if any(t is tile for t in player.rack.tiles):
+            continue
+        holder = next(h for h in [game.pouch] + [p.rack for p in game.players[1:]]
+                      if any(t is tile for t in h.tiles))
+        swap = spare.pop()
+        holder.tiles = [swap if t is tile else t for t in holder.tiles]
+        player.rack.tiles = [tile if t is swap else t for t in player.rack.tiles]
+    return game, player
+
+
+def test_search_leaves_the_game_alone():
+    game, player = opening_position()
+    before = game.snapshot()
+    policy = MCTSPolicy(iterations=40, time_limit=None, seed=1)
+    game.start_turn(player)
+    policy.search(game, player)
+    game.revert()
+    assert game.snapshot() == before
+
+
+def test_plays_the_opening_meld():
+    for seed in range(3):
+        game, player = opening_position()
+        policy = MCTSPolicy(iterations=60, time_limit=None, seed=seed)
+        game.start_turn(player)
+        policy.play_turn(game, player, game.rng)
+        assert game.finish_turn(player) == 'played'
+        assert not player.in_quarantine
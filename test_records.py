@@ -0,0 +1,127 @@
+import random
+import pytest
+from records import Recorder, GameRecord, GameWriter, GameReader, Replay, UNDO, REDO, zigzag, unzigzag
+from rummikub import Color, Game
+from selfplay import COLORS, RandomPolicy, play_game
+
+# seeded games, their records, and replaying them from the record, sequentially and through Replay's snapshots
+
+
+class UndoingPolicy:
+    # plays like RandomPolicy, then now and then takes back some of its moves and makes some of them again, so
+    # records have UNDO and REDO events
+    def __init__(self, rng):
+        self.rng = rng
+        self.policy = RandomPolicy()
+
+    def play_turn(self, game, player, rng):
+        self.policy.play_turn(game, player, rng)
+        undoable = game.journal.undoable()
+        if undoable and self.rng.random() < 0.5:
+            game.undo(self.rng.randint(1, undoable))
+            undone = len(game.journal.undone)
+            if self.rng.random() < 0.5:
+                game.redo(self.rng.randint(1, undone))
+        if not game.board.check_board_validity(player):
+            game.undo(game.journal.undoable())
+
+
+def recorded_game(seed, num_players=2, max_turns=200):
+    game = Game(num_players=num_players, num_jokers=2, colors=[Color(c) for c in COLORS], seed=seed)
+    recorder = Recorder(game)
+    policies = [UndoingPolicy(random.Random(seed + i)) for i in range(num_players)]
+    for _ in range(max_turns):
+        if game.end:
+            break
+        player = game.players[game.current]
+        game.start_turn(player)
+        policies[game.current].play_turn(game, player, game.rng)
+        game.finish_turn(player)
+    return game, recorder.detach(game)
+
+
+def position(game):
+    return game.snapshot(), game.current, game.end, game.winner
+
+
+def test_same_seed_same_game():
+    first = play_game([RandomPolicy(), RandomPolicy()], seed=7, record=True)
+    second = play_game([RandomPolicy(), RandomPolicy()], seed=7, record=True)
+    assert first['record'] == second['record']
+
+
+def test_replay_matches_the_game():
+    for seed in range(5):
+        game, data = recorded_game(seed)
+        record = GameRecord.decode(data)
+        assert record.seed == seed
+        assert position(record.replay()) == position(game)
+
+
+def test_records_have_undo_and_redo():
+    events = [event for seed in range(5) for event in GameRecord.decode(recorded_game(seed)[1]).events]
+    assert any(event[0] == UNDO for event in events)
+    assert any(event[0] == REDO for event in events)
+
+
+def test_replay_positions_match_sequential_replay():
+    rng = random.Random(1)
+    for seed in range(3):
+        record = GameRecord.decode(recorded_game(seed, num_players=3)[1])
+        replay = Replay(record, interval=4)
+        # every turn start in order, then positions in a random order, each checked against replaying from
+        # the start
+        ks = replay.turn_starts() + [rng.randint(0, len(replay)) for _ in range(40)] + [len(replay)]
+        for k in ks:
+            assert position(replay.position(k)) == position(record.replay(k)), k
+    with pytest.raises(IndexError):
+        replay.position(len(replay) + 1)
+
+
+def test_negative_and_missing_seeds():
+    assert [unzigzag(zigzag(n)) for n in range(-1000, 1000)] == list(range(-1000, 1000))
+    for seed in (-1, -123456789, 0, 1 << 62):
+        game = Game(num_players=2, num_jokers=2, colors=[Color(c) for c in COLORS], seed=seed)
+        assert GameRecord.decode(Recorder(game).detach(game)).seed == seed
+    # a game given its random stream rather than a seed has no seed to record
+    game = Game(num_players=2, num_jokers=2, colors=[Color(c) for c in COLORS], rng=random.Random(1))
+    assert GameRecord.decode(Recorder(game).detach(game)).seed is None
+
+
+def test_writer_and_reader(tmp_path):
+    path = tmp_path / 'games.rec'
+    records = [recorded_game(seed, max_turns=20)[1] for seed in range(4)]
+    with GameWriter(path) as writer:
+        for data in records[:2]:
+            writer.write(data)
+    with GameWriter(path, append=True) as writer:
+        for data in records[2:]:
+            writer.write(data)
+    with GameReader(path) as reader:
+        assert len(reader) == 4
+        assert [bytes(reader.raw(i)) for i in range(4)] == records
+        assert [record.seed for record in reader] == [0, 1, 2, 3]
+
+
+def test_reader_rejects_empty_and_foreign_files(tmp_path):
+    empty = tmp_path / 'empty.rec'
+    empty.write_bytes(b'')
+    foreign = tmp_path / 'foreign.rec'
+    foreign.write_bytes(b'not a record file')
+    for path in (empty, foreign):
+        with pytest.raises(ValueError):
+            GameReader(path)
+    with pytest.raises(ValueError):
+        GameWriter(foreign, append=True)
+
+
+def test_snapshot_keeps_draw_order_and_random_stream():
+    game, _ = recorded_game(1, max_turns=10)
+    state = game.snapshot()
+    draws = [tile.code for tile in reversed(game.pouch.tiles)]
+    stream = [game.rng.random() for _ in range(5)]
+    game.pouch.tiles = sorted(game.pouch.tiles, key=lambda tile: tile.code)
+    game.restore(state)
+    assert [tile.code for tile in reversed(game.pouch.tiles)] == draws
+    assert [game.rng.random() for _ in range(5)] == stream
+    assert game.snapshot() == state
@@ -0,0 +1,109 @@
+import json
+import asyncio
+import pytest
+from rummikub import Color, Game, PickTile, Add, Split
+from selfplay import COLORS
+from server import GameServer, decode_action, encode_move
+
+# decoding client actions, and a client playing against a bot over a real connection
+
+
+def new_game(seed=1):
+    game = Game(num_players=2, num_jokers=2, colors=[Color(c) for c in COLORS], seed=seed)
+    player = game.players[0]
+    game.start_turn(player)
+    return game, player
+
+
+def test_moves_round_trip():
+    game, player = new_game()
+    for move in game.possible_moves(player):
+        action = json.loads(json.dumps(encode_move(game, player, move)))
+        decoded = decode_action(game, player, action)
+        assert type(decoded) is type(move)
+        assert encode_move(game, player, decoded) == action
+
+
+def test_pick_only_before_any_move():
+    game, player = new_game()
+    assert isinstance(decode_action(game, player, {'type': 'pick'}), PickTile)
+    tile = player.rack.tiles[0]
+    game.make_move(player, decode_action(game, player, {'type': 'add', 'tile': tile.code, 'set': None}))
+    with pytest.raises(ValueError, match='can\'t draw after making a move'):
+        decode_action(game, player, {'type': 'pick'})
+
+
+def test_bools_are_not_indices():
+    game, player = new_game()
+    for tile in player.rack.tiles[:2]:
+        game.make_move(player, decode_action(game, player, {'type': 'add', 'tile': tile.code, 'set': None}))
+    tile = player.rack.tiles[0]
+    assert isinstance(decode_action(game, player, {'type': 'add', 'tile': tile.code, 'set': 1}), Add)
+    bad = [
+        {'type': 'add', 'tile': tile.code, 'set': True},
+        {'type': 'add', 'tile': True, 'set': None},
+        {'type': 'split', 'set': True, 'at': 1},
+        {'type': 'split', 'set': 0, 'at': True},
+        {'type': 'split', 'set': 0, 'at': 1},
+        {'type': 'nonsense'},
+    ]
+    for action in bad:
+        with pytest.raises(ValueError):
+            decode_action(game, player, action)
+    game.make_move(player, decode_action(game, player, {'type': 'add', 'tile': tile.code, 'set': 1, 'back': True}))
+    assert isinstance(decode_action(game, player, {'type': 'split', 'set': 1, 'at': 1}), Split)
+
+
+async def client_game(max_turns):
+    # a client playing a solver bot, putting down a tile every turn, trying to draw as well and sending one
+    # action too many
+    server = GameServer(turn_timeout=5.0, max_turns=max_turns)
+    listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    received = []
+
+    async def send(message):
+        writer.write(json.dumps(message).encode() + b'\n')
+        await writer.drain()
+
+    async def receive():
+        message = json.loads(await asyncio.wait_for(reader.readline(), 10))
+        received.append(message)
+        return message
+
+    for bad in ({'type': 'join', 'bots': 5}, {'type': 'join', 'bots': [['x']]},
+                {'type': 'join', 'players': True}, {'type': 'join', 'bots': ['nobody']}):
+        await send(bad)
+        assert await receive() == {'type': 'error', 'message': 'bad table setup'}
+    await send({'type': 'pick'})
+    assert (await receive())['message'] == 'join a table first'
+    await send({'type': 'join', 'players': 2, 'bots': ['solver']})
+    joined = await receive()
+    assert joined['seat'] == 1
+    while True:
+        message = await receive()
+        if message['type'] == 'end':
+            break
+        if message['type'] == 'state':
+            # put down a tile, then try to draw as well, then end the turn
+            await send({'type': 'add', 'tile': message['rack'][0][0], 'set': None})
+            assert (await receive())['type'] == 'state'
+            await send({'type': 'pick'})
+            assert (await receive())['message'] == 'can\'t draw after making a move'
+            await send({'type': 'done'})
+            # sent once the turn is over, so it must not carry over into the next one
+            await send({'type': 'done'})
+    writer.close()
+    listener.close()
+    await listener.wait_closed()
+    return received
+
+
+def test_client_against_bot():
+    received = asyncio.run(client_game(max_turns=6))
+    turns = [message for message in received if message['type'] == 'turn']
+    assert len(turns) == 6
+    # the client's turns put down one tile, which is never a valid board
+    assert all(turn['result'] == 'invalid' for turn in turns if turn['seat'] == 1)
+    assert any(message.get('message') == 'not your turn' for message in received)
@@ -0,0 +1,71 @@
+import random
+from collections import Counter
+import pytest
+import solver
+from compact import TileCodec
+from meldindex import meld_index
+from rummikub import Group, Run
+
+# the dynamic program against the branch and bound left to finish, on random positions small enough for it
+
+
+class Tile:
+    def __init__(self, code):
+        self.code = code
+
+
+def check_solution(codec, solution, rack, board, in_quarantine):
+    # every set is a meld, board tiles all stay on the board (in quarantine the sets are only the new melds),
+    # and played tiles come off the rack
+    index = meld_index(codec.num_colors, codec.num_jokers)
+    placed = []
+    for s in solution.sets:
+        kinds = [codec.kind_of[tile.code] for tile in s.tiles]
+        if isinstance(s, Run):
+            assert index.run_value(kinds) is not None
+        elif isinstance(s, Group):
+            assert index.group_value(kinds) is not None
+        else:
+            assert index.meld_value(kinds) is not None
+        placed.extend(s.tiles)
+    assert Counter(map(id, placed)) == Counter(map(id, ([] if in_quarantine else board) + solution.played))
+    assert not Counter(map(id, solution.played)) - Counter(map(id, rack))
+    assert solution.value == sum(codec.number_of[tile.code] for tile in solution.played)
+    if in_quarantine and solution.played:
+        assert solution.meld_value >= solver.QUARANTINE_POINTS
+
+
+def random_position(sv, rng):
+    # a board of random melds, and a rack of random tiles from what is left
+    codec = sv.codec
+    free = {}
+    for code in rng.sample(range(codec.num_tiles), codec.num_tiles):
+        free.setdefault(codec.kind_of[code], []).append(code)
+    board = []
+    for _ in range(rng.randint(0, 12)):
+        meld = rng.choice(sv.melds)
+        if all(len(free.get(kind, ())) >= count for kind, count in meld.counts):
+            board.extend(Tile(free[kind].pop()) for kind in meld.kinds)
+    left = [code for codes in free.values() for code in codes]
+    rack = [Tile(code) for code in rng.sample(left, min(len(left), rng.randint(6, 14)))]
+    return rack, board, rng.random() < 0.3
+
+
+@pytest.mark.parametrize('num_colors, num_jokers', [(4, 2), (4, 1), (4, 0), (3, 2), (5, 2)])
+def test_program_matches_branch_and_bound(num_colors, num_jokers, monkeypatch):
+    sv = solver.MeldSolver(TileCodec(num_colors, num_jokers))
+    rng = random.Random(num_colors * 10 + num_jokers)
+    for _ in range(30):
+        rack, board, in_quarantine = random_position(sv, rng)
+        monkeypatch.setattr(solver, 'HEAD_START', 1e9)
+        exact = sv.solve(rack, board, in_quarantine)
+        # no head start, so the dynamic program does all the work
+        monkeypatch.setattr(solver, 'HEAD_START', 0.0)
+        program = sv.solve(rack, board, in_quarantine)
+        if exact is None:
+            assert program is None
+            continue
+        assert program is not None and program.optimal
+        assert program.value == exact.value
+        check_solution(sv.codec, program, rack, board, in_quarantine)
+        check_solution(sv.codec, exact, rack, board, in_quarantine)
@@ -0,0 +1,110 @@
+import random
+import numpy as np
+import pytest
+from compact import TileCodec
+from meldindex import MeldIndex
+from observations import MAX_SET_LENGTH
+from validation import check_sets, check_boards, encode_boards, IncrementalValidator, GROUP_CODE, RUN_CODE, \
+    TEMP_CODE
+from rummikub import Color, Game
+from selfplay import COLORS, RandomPolicy
+
+# the numpy validator against the meld index, which tabulates the same rules set by set
+
+
+def random_sets(index, codec, rng, count):
+    # half of them melds from the index, some with a tile swapped, shuffled or dropped, the rest random tiles
+    melds = list(index.runs) + list(index.groups)
+    sets = []
+    for _ in range(count):
+        if rng.random() < 0.5:
+            kinds = list(rng.choice(melds))
+            change = rng.randrange(4)
+            if change == 1:
+                kinds[rng.randrange(len(kinds))] = rng.randrange(codec.num_kinds)
+            elif change == 2:
+                rng.shuffle(kinds)
+            elif change == 3:
+                del kinds[rng.randrange(len(kinds))]
+        else:
+            kinds = [rng.randrange(codec.num_kinds) for _ in range(rng.randint(1, 6))]
+        sets.append(kinds)
+    return sets
+
+
+@pytest.mark.parametrize('num_colors, num_jokers', [(4, 2), (3, 1), (5, 2), (4, 0)])
+def test_check_sets_matches_meld_index(num_colors, num_jokers):
+    codec = TileCodec(num_colors, num_jokers)
+    index = MeldIndex(num_colors, num_jokers)
+    rng = random.Random(num_colors * 10 + num_jokers)
+    sets = random_sets(index, codec, rng, 20000)
+    kinds = np.full((len(sets), MAX_SET_LENGTH), -1, np.int64)
+    for n, s in enumerate(sets):
+        kinds[n, :len(s)] = s
+    set_type = np.array([rng.choice((GROUP_CODE, RUN_CODE, TEMP_CODE)) for _ in sets])
+    valid, points, is_run = check_sets(kinds, set_type, codec)
+    for n, s in enumerate(sets):
+        if set_type[n] == RUN_CODE:
+            value = index.run_value(s)
+            expected = None if value is None else (True, value)
+        elif set_type[n] == GROUP_CODE:
+            value = index.group_value(s)
+            expected = None if value is None else (False, value)
+        else:
+            expected = index.meld_value(s)
+        if expected is None:
+            assert not valid[n], s
+        else:
+            assert valid[n], s
+            assert (bool(is_run[n]), int(points[n])) == expected, s
+
+
+def test_check_boards_matches_board_validity():
+    # boards of real games, against Board.check_board_validity for both quarantine states
+    rng = random.Random(3)
+    boards = []
+    for seed in range(20):
+        game = Game(num_players=2, num_jokers=2, colors=[Color(c) for c in COLORS], seed=seed)
+        policy = RandomPolicy()
+        for _ in range(30):
+            if game.end:
+                break
+            player = game.players[game.current]
+            game.start_turn(player)
+            policy.play_turn(game, player, rng)
+            # copies, since the game goes on changing its sets in place
+            sets = [type(s)(list(s.tiles)) for s in game.board.sets]
+            in_quarantine = player.in_quarantine
+            for quarantine in (False, True):
+                player.in_quarantine = quarantine
+                boards.append((sets, quarantine, game.board.check_board_validity(player)))
+            player.in_quarantine = in_quarantine
+            game.finish_turn(player)
+    codec = game.codec
+    board, set_type = encode_boards(codec, [sets for sets, _, _ in boards])
+    in_quarantine = np.array([quarantine for _, quarantine, _ in boards])
+    valid = check_boards(board, set_type, in_quarantine, codec)[0]
+    assert valid.tolist() == [expected for _, _, expected in boards]
+
+
+def test_incremental_validator_matches_full_check():
+    codec = TileCodec(4, 2)
+    index = MeldIndex(4, 2)
+    rng = random.Random(5)
+    num_boards, num_sets = 16, 6
+    validator = IncrementalValidator(codec, num_boards, max_sets=num_sets)
+    board = np.zeros((num_boards, num_sets, MAX_SET_LENGTH), np.int8)
+    set_type = np.zeros((num_boards, num_sets), np.int8)
+    for _ in range(200):
+        # change a few slots of some boards, then check a random subset of boards both ways
+        for kinds in random_sets(index, codec, rng, 8):
+            n, s = rng.randrange(num_boards), rng.randrange(num_sets)
+            board[n, s] = 0
+            board[n, s, :len(kinds)] = np.array(kinds) + 1
+            set_type[n, s] = rng.choice((GROUP_CODE, RUN_CODE, TEMP_CODE))
+        rows = sorted(rng.sample(range(num_boards), 5))
+        in_quarantine = np.array([rng.random() < 0.5 for _ in rows])
+        got = validator.validate(rows, board[rows], set_type[rows], in_quarantine)
+        expected = check_boards(board[rows], set_type[rows], in_quarantine, codec)
+        for a, b in zip(got, (expected[0], expected[1], expected[4])):
+            assert np.array_equal(a, b)
@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import importlib.util
+import math
+import time
+import random
+import argparse
+import itertools
+import multiprocessing
+import numpy as np
+from selfplay import COLORS, RandomPolicy, SolverPolicy, play_game
+from mcts import MCTSPolicy
+
+# tournaments between agents: round robin over every table of agents, or swiss rounds that seat agents of
+# similar rating together. games are spread over a process pool and every finished game is appended to a JSON
+# lines file straight away, so a run that gets interrupted picks up where it stopped when started again with
+# the same file. a game is only reused when it was the same match: its key names the seats and the seed, and
+# games played with other jokers, colors or turn limits are left out.
+#
+# ratings are elo fitted to all the games at once (bradley-terry by maximum likelihood), so they don't depend
+# on the order games finished in. a game between more than two players counts as a result between every pair
+# at the table: the winner beats everybody, and the others are ranked by what they have left on their racks.
+# those pairs aren't independent, so the confidence intervals, from the curvature of the likelihood, are on
+# the narrow side for 3 and 4 player tables.
+
+AGENTS = {
+    'random': RandomPolicy,
+    'solver': SolverPolicy,
+    'mcts': lambda: MCTSPolicy(time_limit=0.1),
+    'mcts-heuristic': lambda: MCTSPolicy(time_limit=0.1, heuristic=True),
+}
+
+ELO_SCALE = 400 / math.log(10)
+ELO_BASE = 1500
+
+
+def match_key(kind, seats, seed):
+    # what a game is looked up by when resuming, so a game is only reused for the same agents in the same
+    # seats (and so the same number of players) dealt the same tiles
+    return f'{kind}:{",".join(seats)}:{seed}'
+
+
+def round_robin(agents, num_players, games_per_table, seed=0):
+    # every table of num_players different agents, games_per_table times, rotating who sits first
+    matches = []
+    for t, table in enumerate(itertools.combinations(agents, num_players)):
+        for g in range(games_per_table):
+            shift = g % num_players
+            seats = list(table[shift:] + table[:shift])
+            game_seed = seed * 1000003 + t * 1009 + g
+            matches.append({'match': match_key('rr', seats, game_seed), 'agents': seats, 'seed': game_seed})
+    return matches
+
+
+def swiss_round(agents, ratings, num_players, games_per_table, round_number, seed=0):
+    # agents sorted by rating and seated num_players at a time. when the agents don't divide evenly, the
+    # lowest rated ones also fill up the last table
+    ranked = sorted(agents, key=lambda agent: (-ratings.get(agent, ELO_BASE), agent))
+    tables = [ranked[i:i + num_players] for i in range(0, len(ranked), num_players)]
+    if len(tables[-1]) < num_players:
+        short = tables.pop()
+        tables.append(ranked[len(ranked) - num_players:] if len(ranked) >= num_players else short)
+    matches = []
+    for t, table in enumerate(tables):
+        for g in range(games_per_table):
+            shift = g % num_players
+            seats = table[shift:] + table[:shift]
+            game_seed = seed * 1000003 + round_number * 100003 + t * 1009 + g
+            matches.append({'match': match_key(f'sw{round_number}', seats, game_seed), 'agents': seats,
+                            'seed': game_seed, 'round': round_number})
+    return matches
+
+
+def pairwise(result):
+    # (winner, loser, score) for every pair at the table, score being 1 for a win and 0.5 for a draw
+    agents = result['agents']
+    rank = [0 if result['winner'] == i else 1 for i in range(len(agents))]
+    outcomes = []
+    for i, j in itertools.combinations(range(len(agents)), 2):
+        if agents[i] == agents[j]:
+            continue
+        a = (rank[i], result['scores'][i])
+        b = (rank[j], result['scores'][j])
+        if a == b:
+            outcomes.append((agents[i], agents[j], 0.5))
+        elif a < b:
+            outcomes.append((agents[i], agents[j], 1.0))
+        else:
+            outcomes.append((agents[j], agents[i], 1.0))
+    return outcomes
+
+
+def fit_elo(agents, results, prior=1.0, iterations=1000, tolerance=1e-9):
+    # maximum likelihood elo for every agent and its standard error. prior adds that many drawn games between
+    # every pair, which keeps an agent that never won at a finite rating
+    index = {agent: i for i, agent in enumerate(agents)}
+    n = len(agents)
+    wins = np.full((n, n), prior / 2)
+    np.fill_diagonal(wins, 0)
+    for result in results:
+        for a, b, score in pairwise(result):
+            wins[index[a], index[b]] += score
+            wins[index[b], index[a]] += 1 - score
+    games = wins + wins.T
+    strength = np.ones(n)
+    # minorization-maximization updates for the bradley-terry model
+    for _ in range(iterations):
+        denominator = (games / (strength[:, None] + strength[None, :])).sum(1)
+        updated = wins.sum(1) / denominator
+        updated /= np.exp(np.log(updated).mean())
+        done = np.abs(updated - strength).max() < tolerance
+        strength = updated
+        if done:
+            break
+    # standard errors from the inverse of the fisher information, in natural log strength
+    p = strength[:, None] * strength[None, :] / (strength[:, None] + strength[None, :]) ** 2
+    information = -games * p
+    np.fill_diagonal(information, 0)
+    np.fill_diagonal(information, -information.sum(1))
+    covariance = np.linalg.pinv(information)
+    elo = ELO_BASE + ELO_SCALE * np.log(strength)
+    error = ELO_SCALE * np.sqrt(np.maximum(np.diag(covariance), 0))
+    return {agent: (float(elo[i]), float(error[i])) for agent, i in index.items()}
+
+
+def fit_trueskill(agents, results):
+    # (mu, sigma) per agent from the trueskill package, if it is installed, rating games in the order they
+    # were scheduled
+    import trueskill
+    ratings = {agent: trueskill.Rating() for agent in agents}
+    for result in sorted(results, key=lambda r: (r.get('round', -1), r['seed'])):
+        seats = result['agents']
+        if len(set(seats)) < len(seats):
+            continue
+        ranks = [(0 if result['winner'] == i else 1, result['scores'][i]) for i in range(len(seats))]
+        order = sorted(set(ranks))
+        rated = trueskill.rate([(ratings[agent],) for agent in seats], ranks=[order.index(r) for r in ranks])
+        for agent, (rating,) in zip(seats, rated):
+            ratings[agent] = rating
+    return {agent: (rating.mu, rating.sigma) for agent, rating in ratings.items()}
+
+
+def load_results(path, settings):
+    # the games already played by an earlier run with the same output file and game settings
+    results = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # the last line of a run that was killed mid-write
+                    continue
+                if result.get('settings') == settings:
+                    results[result['match']] = result
+    return results
+
+
+# set up once per worker process by _init_worker
+_worker = {}
+
+
+def _init_worker(settings, seed):
+    _worker.update(settings=settings, policies={})
+    random.seed(seed * 1000003 + multiprocessing.current_process().pid)
+
+
+def _play(match):
+    policies = _worker['policies']
+    seats = []
+    for agent in match['agents']:
+        if agent not in policies:
+            policies[agent] = AGENTS[agent]()
+        seats.append(policies[agent])
+    settings = _worker['settings']
+    result = play_game(seats, match['seed'], settings['num_jokers'], settings['colors'], settings['max_turns'])
+    result.update(match=match['match'], agents=match['agents'], settings=settings)
+    if 'round' in match:
+        result['round'] = match['round']
+    return result
+
+
+class Tournament:
+    def __init__(self, agents, num_players=2, num_jokers=2, colors=COLORS, max_turns=1000, workers=None,
+                 out=None, seed=0):
+        agents = list(dict.fromkeys(agents))
+        if not 2 <= num_players <= 4 or num_players > len(agents):
+            raise ValueError(f'can\'t seat {len(agents)} agents at tables of {num_players}')
+        self.agents = agents
+        self.num_players = num_players
+        # stored with every game, and compared when resuming. colors as a list, the way JSON gives it back
+        self.settings = dict(num_jokers=num_jokers, colors=list(colors), max_turns=max_turns)
+        self.workers = workers
+        self.out = out
+        self.seed = seed
+        # games of agents that aren't in this tournament can't be rated with it
+        self.results = {match: result for match, result in load_results(out, self.settings).items()
+                        if set(result['agents']) <= set(agents)}
+
+    def play(self, matches):
+        # plays the matches that aren't in the results yet, saving each game as it finishes
+        todo = [match for match in matches if match['match'] not in self.results]
+        if not todo:
+            return
+        out = open(self.out, 'a') if self.out else None
+        try:
+            with multiprocessing.Pool(self.workers, _init_worker, (self.settings, self.seed)) as pool:
+                for result in pool.imap_unordered(_play, todo):
+                    self.results[result['match']] = result
+                    if out is not None:
+                        out.write(json.dumps(result) + '\n')
+                        out.flush()
+        finally:
+            if out is not None:
+                out.close()
+
+    def round_robin(self, games_per_table):
+        self.play(round_robin(self.agents, self.num_players, games_per_table, self.seed))
+
+    def swiss(self, rounds, games_per_table):
+        # each round is seated from the ratings after the swiss rounds before it, and only those, so a resumed
+        # run that already has games of later rounds seats the same tables
+        for round_number in range(rounds):
+            earlier = [result for result in self.results.values()
+                       if 'round' in result and result['round'] < round_number]
+            ratings = {agent: elo for agent, (elo, _) in self.ratings(earlier).items()}
+            self.play(swiss_round(self.agents, ratings, self.num_players, games_per_table, round_number, self.seed))
+
+    def ratings(self, results=None):
+        # from every game played, or just results
+        return fit_elo(self.agents, self.results.values() if results is None else results)
+
+    def standings(self, trueskill=False):
+        # a table of agents by rating, with 95% confidence intervals
+        ratings = self.ratings()
+        skills = fit_trueskill(self.agents, list(self.results.values())) if trueskill else None
+        games = {agent: 0 for agent in self.agents}
+        wins = {agent: 0 for agent in self.agents}
+        for result in self.results.values():
+            for i, agent in enumerate(result['agents']):
+                games[agent] += 1
+                wins[agent] += result['winner'] == i
+        lines = [f'{"agent":16} {"elo":>7} {"95% ci":>7} {"games":>7} {"wins":>6}' + ('  trueskill' if skills else '')]
+        for agent in sorted(self.agents, key=lambda a: -ratings[a][0]):
+            elo, error = ratings[agent]
+            line = f'{agent:16} {elo:7.0f} {"±" + format(1.96 * error, ".0f"):>7} {games[agent]:7} {wins[agent]:6}'
+            if skills:
+                mu, sigma = skills[agent]
+                line += f'  {mu:.1f} ± {3 * sigma:.1f}'
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="play a tournament between agents and rate them")
+    parser.add_argument('agents', nargs='+', choices=sorted(AGENTS))
+    parser.add_argument('--format', default='round-robin', choices=['round-robin', 'swiss'])
+    parser.add_argument('--games', type=int, default=10, help="games per table (per round for swiss)")
+    parser.add_argument('--rounds', type=int, default=5, help="swiss rounds")
+    parser.add_argument('--players', type=int, default=2, help="players per table, 2 to 4")
+    parser.add_argument('--jokers', type=int, default=2)
+    parser.add_argument('--colors', nargs='+', default=COLORS)
+    parser.add_argument('--max-turns', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to one per core")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=None, help="JSON lines file of games, resumed from if it exists")
+    parser.add_argument('--trueskill', action='store_true', help="also rate with the trueskill package")
+    args = parser.parse_args(argv)
+    if args.trueskill and importlib.util.find_spec('trueskill') is None:
+        parser.error('--trueskill needs the trueskill package')
+
+    try:
+        tournament = Tournament(args.agents, args.players, args.jokers, args.colors, args.max_turns, args.workers,
+                                args.out, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+    resumed = len(tournament.results)
+    start = time.perf_counter()
+    if args.format == 'swiss':
+        tournament.swiss(args.rounds, args.games)
+    else:
+        tournament.round_robin(args.games)
+    elapsed = time.perf_counter() - start
+    played = len(tournament.results) - resumed
+    print(f'{played} games in {elapsed:.1f}s ({resumed} resumed)', file=sys.stderr)
+    print(tournament.standings(args.trueskill))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import numpy as np
+from compact import NUMBERS
+from meldindex import MIN_SET, MAX_GROUP
+from observations import SET_TYPE_CODES, MAX_SETS, MAX_SET_LENGTH
+from rummikub import Group, Run, TempSet
+
+# board validation for many candidate boards at once, in numpy. boards are arrays in the layout observations.py
+# and vecenv.py use: board[n, s, i] is kind + 1 of tile i of set s (0 for an empty spot, tiles packed at the
+# front) and set_type[n, s] one of SET_TYPE_CODES. the rules are the ones meldindex.py tabulates, computed
+# arithmetically instead of looked up:
+#   a run is one color and consecutive numbers, jokers filling any position, start >= 1 and end <= 13
+#   a group is one number in distinct colors, at most min(4, colors) tiles
+#   both need at least 3 tiles, at least one of them real, and no more jokers than the game has
+#   a temp set is whichever of the two it can be, a run when it is both and that is worth at least as much
+
+QUARANTINE_POINTS = 30
+
+GROUP_CODE = SET_TYPE_CODES[Group]
+RUN_CODE = SET_TYPE_CODES[Run]
+TEMP_CODE = SET_TYPE_CODES[TempSet]
+
+# larger than any kind or number, for masked min/max
+_FAR = 1 << 30
+
+
+def _same(values, real):
+    # whether values agree over the real tiles of each set, and the value they agree on
+    low = np.where(real, values, _FAR).min(-1)
+    high = np.where(real, values, -_FAR).max(-1)
+    return low == high, low
+
+
+def check_sets(kinds, set_type, codec):
+    # per set verdicts for kinds[..., i] (-1 for an empty spot) of any leading shape. returns (valid, points,
+    # is_run), each of shape kinds.shape[:-1]. empty sets are valid and worth nothing
+    kinds = np.asarray(kinds, np.int64)
+    set_type = np.asarray(set_type)
+    present = kinds >= 0
+    joker = kinds == codec.joker_kind
+    real = present & ~joker
+    length = present.sum(-1)
+    jokers = joker.sum(-1)
+    number = kinds % NUMBERS + 1
+    color = kinds // NUMBERS
+
+    base = (length - jokers >= 1) & (jokers <= codec.num_jokers) & (length >= MIN_SET)
+    same_color, _ = _same(color, real)
+    consecutive, start = _same(number - np.arange(kinds.shape[-1]), real)
+    run = base & same_color & consecutive & (start >= 1) & (start + length - 1 <= NUMBERS)
+    run_points = length * start + length * (length - 1) // 2
+
+    same_number, group_number = _same(number, real)
+    color_counts = (real[..., None] & (color[..., None] == np.arange(codec.num_colors))).sum(-2)
+    group = base & same_number & (color_counts <= 1).all(-1) & (length <= min(MAX_GROUP, codec.num_colors))
+    group_points = group_number * length
+
+    temp_run = run & (~group | (run_points >= group_points))
+    is_run = np.where(set_type == RUN_CODE, True, np.where(set_type == GROUP_CODE, False, temp_run))
+    valid = np.where(set_type == RUN_CODE, run, np.where(set_type == GROUP_CODE, group, run | group))
+    points = np.where(valid, np.where(is_run, run_points, group_points), 0)
+    empty = length == 0
+    return valid | empty, points, is_run & ~empty
+
+
+def board_verdicts(set_valid, set_points, set_type, in_quarantine):
+    # whole board verdicts from per set ones: every set valid, and a player in quarantine putting down at
+    # least QUARANTINE_POINTS in temp sets. returns (valid, temp_points)
+    temp_points = np.where(set_type == TEMP_CODE, set_points, 0).sum(-1)
+    valid = set_valid.all(-1) & (~np.asarray(in_quarantine, np.bool_) | (temp_points >= QUARANTINE_POINTS))
+    return valid, temp_points
+
+
+def check_boards(board, set_type, in_quarantine, codec):
+    # validates every board in one pass. returns (valid, temp_points, set_valid, set_points, set_is_run)
+    set_valid, set_points, set_is_run = check_sets(np.asarray(board, np.int64) - 1, set_type, codec)
+    valid, temp_points = board_verdicts(set_valid, set_points, set_type, in_quarantine)
+    return valid, temp_points, set_valid, set_points, set_is_run
+
+
+def encode_boards(codec, boards, max_sets=MAX_SETS, max_set_length=MAX_SET_LENGTH):
+    # (board, set_type) arrays for candidate boards given as lists of Group/Run/TempSet objects
+    board = np.zeros((len(boards), max_sets, max_set_length), np.int8)
+    set_type = np.zeros((len(boards), max_sets), np.int8)
+    kind_of = codec.kind_of
+    for n, sets in enumerate(boards):
+        for s, board_set in enumerate(sets):
+            board[n, s, :len(board_set.tiles)] = [kind_of[tile.code] + 1 for tile in board_set.tiles]
+            set_type[n, s] = SET_TYPE_CODES[type(board_set)]
+    return board, set_type
+
+
+class IncrementalValidator:
+    # validates a fixed set of boards over and over, like the games of a VectorEnv, keeping the verdict of
+    # every set slot and only checking again the slots whose tiles or type changed since the last call
+    def __init__(self, codec, num_boards, max_sets=MAX_SETS, max_set_length=MAX_SET_LENGTH):
+        self.codec = codec
+        self.board = np.zeros((num_boards, max_sets, max_set_length), np.int8)
+        self.set_type = np.zeros((num_boards, max_sets), np.int8)
+        # every slot starts out empty, which is valid and worth nothing
+        self.set_valid = np.ones((num_boards, max_sets), np.bool_)
+        self.set_points = np.zeros((num_boards, max_sets), np.int64)
+        self.set_is_run = np.zeros((num_boards, max_sets), np.bool_)
+        # how many set slots have been checked, to see how much the cache saves
+        self.checked = 0
+
+    def validate(self, rows, board, set_type, in_quarantine):
+        # board, set_type and in_quarantine hold the current state of the boards numbered rows. returns
+        # (valid, temp_points, set_is_run) for them
+        rows = np.asarray(rows, np.int64)
+        changed = (board != self.board[rows]).any(-1) | (set_type != self.set_type[rows])
+        r, s = np.nonzero(changed)
+        if len(r):
+            kinds = board[r, s]
+            types = set_type[r, s]
+            valid, points, is_run = check_sets(kinds.astype(np.int64) - 1, types, self.codec)
+            n = rows[r]
+            self.board[n, s] = kinds
+            self.set_type[n, s] = types
+            self.set_valid[n, s] = valid
+            self.set_points[n, s] = points
+            self.set_is_run[n, s] = is_run
+            self.checked += len(r)
+        valid, temp_points = board_verdicts(self.set_valid[rows], self.set_points[rows], set_type, in_quarantine)
+        return valid, temp_points, self.set_is_run[rows]
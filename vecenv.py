@@ -0,0 +1,328 @@
+import numpy as np
+from compact import TileCodec
+from meldindex import meld_index
+from observations import ActionSpace, allocate, MAX_SETS, MAX_SET_LENGTH
+from validation import IncrementalValidator
+
+# many games stepped in lockstep, gym VectorEnv style. there are no Game objects here: every game is a row in
+# a handful of numpy arrays (structure of arrays) and a step applies each kind of action to all the games
+# that chose it at once with array indexing.
+#
+# actions are the ones of observations.ActionSpace, and observations come in the same arrays that
+# observations.encode makes for Game objects, so a policy trained on one works on the other. board slots can
+# have holes here, since sets are never moved around to close the gap a removed set leaves.
+
+RACK_SIZE = 14
+
+# set_type values, the same codes observations.SET_TYPE_CODES uses
+EMPTY = 0
+GROUP_SLOT = 1
+RUN_SLOT = 2
+TEMP_SLOT = 3
+
+
+class VectorEnv:
+    def __init__(self, num_envs, num_players=2, num_jokers=2, num_colors=4, max_turns=1000, seed=None):
+        self.num_envs = num_envs
+        self.num_players = num_players
+        self.max_turns = max_turns
+        self.codec = codec = TileCodec(num_colors, num_jokers)
+        self.index = meld_index(num_colors, num_jokers)
+        self.action_space = ActionSpace(codec.num_kinds)
+        self.rng = np.random.default_rng(seed)
+        self.tile_kinds = np.asarray(codec.kind_of, np.int8)
+
+        n, k, t = num_envs, codec.num_kinds, codec.num_tiles
+        self.racks = np.zeros((n, num_players, k), np.int8)
+        # kind + 1 of every tile in every set, 0 for an empty spot
+        self.board = np.zeros((n, MAX_SETS, MAX_SET_LENGTH), np.int8)
+        self.set_len = np.zeros((n, MAX_SETS), np.int8)
+        self.set_type = np.zeros((n, MAX_SETS), np.int8)
+        # the shuffled pouch, drawn from the front
+        self.pouch = np.zeros((n, t), np.int8)
+        self.pouch_top = np.zeros(n, np.int16)
+        self.in_quarantine = np.ones((n, num_players), np.bool_)
+        self.first_move = np.ones(n, np.bool_)
+        self.current = np.zeros(n, np.int64)
+        self.turn_rack_size = np.zeros(n, np.int16)
+        self.turns_without_play = np.zeros(n, np.int16)
+        self.turns = np.zeros(n, np.int32)
+        # the position at the start of the turn, which an invalid turn is rolled back to
+        self.saved_board = np.zeros_like(self.board)
+        self.saved_set_len = np.zeros_like(self.set_len)
+        self.saved_set_type = np.zeros_like(self.set_type)
+        self.saved_rack = np.zeros((n, k), np.int8)
+        self.saved_pouch_top = np.zeros_like(self.pouch_top)
+
+        self.obs = allocate(n, k)
+        # verdicts of every set slot, only worked out again for the slots that changed since the last check
+        self.validator = IncrementalValidator(codec, n)
+        # per distinct set, (set type, kinds) -> the kinds that can be added to it
+        self._adds = {}
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self._reset(np.arange(self.num_envs))
+        return self._observe()
+
+    def _reset(self, envs):
+        m = len(envs)
+        if not m:
+            return
+        p, k = self.num_players, self.codec.num_kinds
+        self.pouch[envs] = self.rng.permuted(np.tile(self.tile_kinds, (m, 1)), axis=1)
+        # deal RACK_SIZE tiles to every player, counting kinds for all racks with one bincount
+        dealt = self.pouch[envs, :p * RACK_SIZE].reshape(m, p, RACK_SIZE).astype(np.int64)
+        dealt += (np.arange(m * p) * k).reshape(m, p, 1)
+        self.racks[envs] = np.bincount(dealt.ravel(), minlength=m * p * k).reshape(m, p, k)
+        self.pouch_top[envs] = p * RACK_SIZE
+        self.board[envs] = 0
+        self.set_len[envs] = 0
+        self.set_type[envs] = EMPTY
+        self.in_quarantine[envs] = True
+        self.current[envs] = 0
+        self.turns[envs] = 0
+        self.turns_without_play[envs] = 0
+        self._start_turn(envs)
+
+    def _start_turn(self, envs):
+        cur = self.current[envs]
+        self.first_move[envs] = True
+        self.turn_rack_size[envs] = self.racks[envs, cur].sum(1)
+        self.saved_board[envs] = self.board[envs]
+        self.saved_set_len[envs] = self.set_len[envs]
+        self.saved_set_type[envs] = self.set_type[envs]
+        self.saved_rack[envs] = self.racks[envs, cur]
+        self.saved_pouch_top[envs] = self.pouch_top[envs]
+
+    def _revert(self, envs):
+        self.board[envs] = self.saved_board[envs]
+        self.set_len[envs] = self.saved_set_len[envs]
+        self.set_type[envs] = self.saved_set_type[envs]
+        self.racks[envs, self.current[envs]] = self.saved_rack[envs]
+        self.pouch_top[envs] = self.saved_pouch_top[envs]
+
+    def _draw(self, envs):
+        envs = envs[self.pouch_top[envs] < self.codec.num_tiles]
+        kinds = self.pouch[envs, self.pouch_top[envs]]
+        self.racks[envs, self.current[envs], kinds] += 1
+        self.pouch_top[envs] += 1
+
+    def _empty_slot(self, envs):
+        # first free set slot of each game, and whether there is one
+        empty = self.set_len[envs] == 0
+        return empty.argmax(1), empty.any(1)
+
+    def _insert(self, envs, slots, kinds, back):
+        rows = self.board[envs, slots]
+        shifted = np.empty_like(rows)
+        shifted[:, 0] = kinds + 1
+        shifted[:, 1:] = rows[:, :-1]
+        rows = np.where(back[:, None], rows, shifted)
+        at_back = np.flatnonzero(back)
+        rows[at_back, self.set_len[envs[at_back], slots[at_back]]] = kinds[at_back] + 1
+        self.board[envs, slots] = rows
+        self.set_len[envs, slots] += 1
+
+    def step(self, actions):
+        # applies one action per game. returns (observations, rewards, terminated, truncated, info). rewards
+        # are per player, +1 for the winner and -1 for everyone else once a game is won. finished games are
+        # reset straight away, so the observations returned for them are of the new game. the observation
+        # arrays are reused every step
+        space = self.action_space
+        actions = np.asarray(actions, np.int64)
+        envs = np.arange(self.num_envs)
+        cur = self.current
+        legal = np.zeros(self.num_envs, np.bool_)
+
+        # drawing is only allowed before anything else was done this turn, see action_masks
+        pick = envs[(actions == space.PICK) & self.first_move]
+        self.first_move[pick] = False
+        self._draw(pick)
+        legal[pick] = True
+        legal[actions == space.DONE] = True
+
+        chosen = (actions >= space.split_offset) & (actions < space.add_rack_offset)
+        if chosen.any():
+            n = envs[chosen]
+            s, pos = np.divmod(actions[n] - space.split_offset, MAX_SET_LENGTH - 1)
+            pos += 1
+            new, has_slot = self._empty_slot(n)
+            length = self.set_len[n, s].astype(np.int64)
+            ok = has_slot & (pos < length)
+            n, s, pos, new, length = n[ok], s[ok], pos[ok], new[ok], length[ok]
+            rows = self.board[n, s]
+            j = np.arange(MAX_SET_LENGTH)
+            source = pos[:, None] + j
+            tail = np.take_along_axis(rows, np.minimum(source, MAX_SET_LENGTH - 1), 1)
+            self.board[n, new] = np.where(source < length[:, None], tail, 0)
+            self.board[n, s] = np.where(j < pos[:, None], rows, 0)
+            self.set_len[n, new] = length - pos
+            self.set_len[n, s] = pos
+            self.set_type[n, new] = TEMP_SLOT
+            self.set_type[n, s] = TEMP_SLOT
+            legal[n] = True
+
+        chosen = (actions >= space.add_rack_offset) & (actions < space.add_board_offset)
+        if chosen.any():
+            n = envs[chosen]
+            rest, back = np.divmod(actions[n] - space.add_rack_offset, 2)
+            kinds, s = np.divmod(rest, MAX_SETS)
+            length = self.set_len[n, s]
+            ok = (self.racks[n, cur[n], kinds] > 0) & (length > 0) & (length < MAX_SET_LENGTH)
+            n, s, kinds, back = n[ok], s[ok], kinds[ok], back[ok].astype(np.bool_)
+            self._insert(n, s, kinds, back)
+            self.racks[n, cur[n], kinds] -= 1
+            self.first_move[n] = False
+            legal[n] = True
+
+        chosen = (actions >= space.add_board_offset) & (actions < space.new_set_offset)
+        if chosen.any():
+            n = envs[chosen]
+            rest, back = np.divmod(actions[n] - space.add_board_offset, 2)
+            source, s = np.divmod(rest, MAX_SETS)
+            length = self.set_len[n, s]
+            ok = (self.set_len[n, source] == 1) & (source != s) & (length > 0) & (length < MAX_SET_LENGTH)
+            n, s, source, back = n[ok], s[ok], source[ok], back[ok].astype(np.bool_)
+            kinds = self.board[n, source, 0].astype(np.int64) - 1
+            self.board[n, source] = 0
+            self.set_len[n, source] = 0
+            self.set_type[n, source] = EMPTY
+            self._insert(n, s, kinds, back)
+            legal[n] = True
+
+        chosen = actions >= space.new_set_offset
+        if chosen.any():
+            n = envs[chosen]
+            kinds = actions[n] - space.new_set_offset
+            new, has_slot = self._empty_slot(n)
+            ok = has_slot & (self.racks[n, cur[n], kinds] > 0)
+            n, kinds, new = n[ok], kinds[ok], new[ok]
+            self.board[n, new, 0] = kinds + 1
+            self.set_len[n, new] = 1
+            self.set_type[n, new] = TEMP_SLOT
+            self.racks[n, cur[n], kinds] -= 1
+            self.first_move[n] = False
+            legal[n] = True
+
+        # picking a tile or hitting done ends the turn
+        rewards = np.zeros((self.num_envs, self.num_players), np.float32)
+        terminated = np.zeros(self.num_envs, np.bool_)
+        truncated = np.zeros(self.num_envs, np.bool_)
+        winner = np.full(self.num_envs, -1, np.int64)
+        finishing = envs[((actions == space.PICK) & legal) | (actions == space.DONE)]
+        if len(finishing):
+            won, stalled, out_of_turns, acting = self._finish(finishing)
+            ended = finishing[won]
+            rewards[ended] = -1
+            rewards[ended, acting[won]] = 1
+            winner[ended] = acting[won]
+            terminated[finishing] = won | stalled
+            truncated[finishing] = out_of_turns & ~(won | stalled)
+            self._reset(finishing[won | stalled | out_of_turns])
+        info = {'winner': winner, 'legal': legal}
+        return self._observe(), rewards, terminated, truncated, info
+
+    def _finish(self, envs):
+        # the end of turn rules of Game.finish_turn for a batch of games
+        cur = self.current[envs]
+        valid, _, is_run = self.validator.validate(envs, self.board[envs], self.set_type[envs],
+                                                   self.in_quarantine[envs, cur])
+        played = valid & (self.racks[envs, cur].sum(1) < self.turn_rack_size[envs])
+        drew = valid & self.first_move[envs]
+
+        self._revert(envs[~valid])
+        self._draw(envs[~valid | drew])
+        fixed = valid & ~drew
+        types = self.set_type[envs[fixed]]
+        fixed_types = np.where(is_run[fixed], RUN_SLOT, GROUP_SLOT)
+        self.set_type[envs[fixed]] = np.where(types == TEMP_SLOT, fixed_types, types)
+        self.in_quarantine[envs[played], cur[played]] = False
+
+        self.turns_without_play[envs] = np.where(played, 0, self.turns_without_play[envs] + 1)
+        self.turns[envs] += 1
+        won = self.racks[envs, cur].sum(1) == 0
+        stalled = ~won & (self.pouch_top[envs] >= self.codec.num_tiles) & (self.turns_without_play[envs] >= self.num_players)
+        out_of_turns = self.turns[envs] >= self.max_turns
+        self.current[envs] = (cur + 1) % self.num_players
+        self._start_turn(envs)
+        return won, stalled, out_of_turns, cur
+
+    def _observe(self):
+        obs = self.obs
+        n = self.num_envs
+        envs = np.arange(n)
+        k = self.codec.num_kinds
+        obs['rack'][:] = self.racks[envs, self.current]
+        obs['board'][:] = self.board
+        obs['set_types'][:] = self.set_type
+        # count board kinds for every game with one bincount, shifting each game into its own range
+        flat = self.board.reshape(n, -1).astype(np.int64) + (np.arange(n) * (k + 1))[:, None]
+        obs['board_counts'][:] = np.bincount(flat.ravel(), minlength=n * (k + 1)).reshape(n, k + 1)[:, 1:]
+        obs['pouch_size'][:] = self.codec.num_tiles - self.pouch_top
+        order = (self.current[:, None] + np.arange(self.num_players)) % self.num_players
+        obs['rack_sizes'][:] = 0
+        obs['rack_sizes'][:, :self.num_players] = np.take_along_axis(self.racks.sum(2), order, 1)
+        obs['quarantine'][:] = False
+        obs['quarantine'][:, :self.num_players] = np.take_along_axis(self.in_quarantine, order, 1)
+        obs['first_move'][:] = self.first_move
+        return obs
+
+    def _addable(self, set_type, kinds):
+        # (front, back) boolean arrays over kinds: which tiles can be added to this set and still let it become
+        # a run or group
+        key = (set_type, kinds)
+        adds = self._adds.get(key)
+        if adds is None:
+            is_run = {RUN_SLOT: True, GROUP_SLOT: False}.get(set_type)
+            num_kinds = self.codec.num_kinds
+            front = np.zeros(num_kinds, np.bool_)
+            back = np.zeros(num_kinds, np.bool_)
+            if len(kinds) < MAX_SET_LENGTH:
+                for kind in range(num_kinds):
+                    # the order of a group doesn't matter, so tiles only go on its back
+                    front[kind] = set_type != GROUP_SLOT and self.index.is_fragment((kind,) + kinds, is_run)
+                    back[kind] = self.index.is_fragment(kinds + (kind,), is_run)
+            adds = self._adds[key] = (front, back)
+        return adds
+
+    def action_masks(self, out=None):
+        # (num_envs, action_space.size) array, True for the actions the move generator would allow
+        space = self.action_space
+        n, k = self.num_envs, self.codec.num_kinds
+        if out is None:
+            out = np.zeros((n, space.size), np.bool_)
+        out[:] = False
+        envs = np.arange(n)
+        rack = self.racks[envs, self.current] > 0
+        lengths = self.set_len.astype(np.int64)
+        has_slot = (lengths == 0).any(1)
+
+        out[:, space.PICK] = self.first_move
+        out[:, space.DONE] = True
+        splits = np.arange(1, MAX_SET_LENGTH)[None, None, :] < lengths[:, :, None]
+        out[:, space.split_offset:space.add_rack_offset] = (splits & has_slot[:, None, None]).reshape(n, -1)
+
+        # addable[game, slot, back, kind]
+        addable = np.zeros((n, MAX_SETS, 2, k), np.bool_)
+        types = self.set_type.tolist()
+        for i, row in enumerate(lengths.tolist()):
+            for s, length in enumerate(row):
+                if length:
+                    front, back = self._addable(types[i][s], tuple((self.board[i, s, :length] - 1).tolist()))
+                    addable[i, s, 0] = front
+                    addable[i, s, 1] = back
+        add_rack = rack[:, :, None, None] & addable.transpose(0, 3, 1, 2)
+        out[:, space.add_rack_offset:space.add_board_offset] = add_rack.reshape(n, -1)
+
+        singles = lengths == 1
+        single_kinds = np.maximum(self.board[:, :, 0].astype(np.int64) - 1, 0)
+        # add_board[game, source, slot, back] = singles[game, source] & addable[game, slot, back, kind of source]
+        gathered = addable[envs[:, None, None, None], np.arange(MAX_SETS)[None, None, :, None],
+                           np.arange(2)[None, None, None, :], single_kinds[:, :, None, None]]
+        add_board = singles[:, :, None, None] & gathered & ~np.eye(MAX_SETS, dtype=np.bool_)[None, :, :, None]
+        out[:, space.add_board_offset:space.new_set_offset] = add_board.reshape(n, -1)
+
+        out[:, space.new_set_offset:] = rack & has_slot[:, None]
+        return out